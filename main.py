@@ -1,36 +1,14 @@
 from __future__ import annotations
 
 import wx
-import os
+import multiprocessing
 
-os.environ.setdefault(
-    "TESSDATA_PREFIX",
-    "C:\\Program Files\\Tesseract-OCR\\tessdata",
-)
-
-from src.utils import console
-from src.preprocess import Preprocessor
-from src.analyze import Analyzer
+from src.program import Program
 from gooey import Gooey, GooeyParser
-from argparse import Namespace
 
 app = wx.App()
 
 
-class Program(Namespace, Preprocessor, Analyzer):
-    command: str
-
-    def invoke(self) -> None:
-        console.FILE.write_text("")
-        func = self._debug if self.debug else getattr(self, self.command, None)
-        if not callable(func):
-            raise TypeError("Invalid command.")
-        func.__call__(self)
-
-    def _debug(self) -> None:
-        console.debug(**{key: val for key, val in self.__dict__.items() if not callable(val)})
-
-
 @Gooey(
     advanced=True,
     program_name="Medical Records Analyzer",
@@ -53,13 +31,13 @@ class Program(Namespace, Preprocessor, Analyzer):
     show_preview_warning=False,
 )
 def main():
-    parser = GooeyParser(description="Process medical record PDF files using LLMs.")
-    subparsers = parser.add_subparsers(help="Commands", dest="command")
-    Program.init_analysis_args(subparsers)
-    Program.init_preprocess_args(subparsers)
+    parser = Program.build_parser(
+        GooeyParser(description="Process medical record PDF files using LLMs.")
+    )
     program: Program = parser.parse_args(namespace=Program())
     program.invoke()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
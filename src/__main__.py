@@ -0,0 +1,33 @@
+"""
+Headless command line entry point, taking the same options as the GUI:
+
+    python -m src analyze --path data/doe_jane --desc "..." --date 2025-01-31
+"""
+
+from __future__ import annotations
+
+from .program import HeadlessParser, Program
+
+import multiprocessing
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = Program.build_parser(
+        HeadlessParser(
+            prog="python -m src",
+            description="Preprocess and analyze medical record PDF files using local tools and LLMs.",
+        )
+    )
+    program: Program = parser.parse_args(argv, namespace=Program())
+    if not program.command:
+        parser.error("a command is required")
+    program.invoke()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -1,14 +1,24 @@
 from __future__ import annotations
 from .extract import Extractor
-from .utils import DATA_DIR, console, retry, timings, dumplocals
+from .utils import DATA_DIR, console, retry, timings, dumplocals, lazy_import
+from .manifest import RunManifest, digest
+from .chunk import PAGE_BREAK, chunk_pages, merge_results
+from .tokens import TokenBudget
+from .telemetry import telemetry
+from .clean import CleanupSettings, OffsetMap, clean_pages
 import datetime as dt
-import math
+import functools
+import asyncio
+import threading
 import json
-import ollama
+import os
 import typing
 
 if typing.TYPE_CHECKING:
     from .typeshed import *
+    import ollama
+else:
+    ollama = lazy_import("ollama")
 
 from pathlib import Path
 
@@ -56,45 +66,249 @@ RESPONSE_SCHEMA = typing.final({
     },
 })
 
-PROMPT_LENGTH = typing.final(
-    len(SYSTEM_PROMPT) + len(PROMPT_TEMPLATE.format(desc="", date="", plaintext=""))
-)
-
 TODAY = dt.datetime.now().date().isoformat()
 
 
+@functools.cache
+def _local_models() -> frozenset[str]:
+    """The models Ollama has locally, listed once per process."""
+    return frozenset(m.model for m in ollama.list().models if m.model)
+
+
+# an event loop and Ollama client per thread, kept across runs so that a long-lived
+# process (see `daemon`) reuses the client and its connections for every job
+_async_state = threading.local()
+
+
+def _runner() -> asyncio.Runner:
+    if (runner := getattr(_async_state, "runner", None)) is None:
+        runner = _async_state.runner = asyncio.Runner()
+    return runner
+
+
+def _async_client() -> ollama.AsyncClient:
+    """The Ollama client of the current thread; it is bound to the loop of `_runner`."""
+    if (client := getattr(_async_state, "client", None)) is None:
+        client = _async_state.client = ollama.AsyncClient()
+    return client
+
+
 class Analyzer(Extractor):
     max_tokens: int = 16000
+    num_predict: int = 4096
+    chunk_overlap: int = 1
+    parallel_requests: int = 2
     temperature: float = 0.2
+    keep_alive: float | str = "60m"
+    unload_model: bool = False
+
+    clean_plaintext: bool = True
+    min_alnum_ratio: float = 0.5
 
     model_id: str = "gemma3n:e4b"
 
+    _request_slots: asyncio.Semaphore
+    _num_ctx: int = 0
+    _model_ready: asyncio.Future[None] | None = None
+
     @property
     def _options(self) -> ollama.Options:
         return ollama.Options(
             temperature=self.temperature,
             num_ctx=self.max_tokens,
-            num_predict=4096,
+            num_predict=self.num_predict,
             use_mlock=True,
             low_vram=True,
         )
 
     debug: bool = False
+    force_analysis: bool = False
 
     desc: str
     date: date
 
+    @functools.cached_property
+    def _tokens(self) -> TokenBudget:
+        return TokenBudget(self.model_id, self.max_tokens, self.num_predict)
+
+    def _count_prompt_tokens(self, prompt: str) -> int:
+        return self._tokens.count(SYSTEM_PROMPT) + self._tokens.count(prompt)
+
+    @property
+    def _cleanup_settings(self) -> CleanupSettings | None:
+        if self.clean_plaintext:
+            return CleanupSettings(min_alnum_ratio=self.min_alnum_ratio)
+        return None
+
+    @property
+    def _parameters(self) -> JSONDict:
+        cleanup = self._cleanup_settings
+        return {
+            "model_id": self.model_id,
+            "options": self._options.model_dump(exclude_none=True),
+            # both decide how the plaintext is split into prompts
+            "tokenizer": self._tokens.source,
+            "chunk_overlap": self.chunk_overlap,
+            "cleanup": cleanup._asdict() if cleanup else None,
+            "accident_info": {
+                "date": self.date.isoformat(),
+                "description": self.desc,
+            },
+        }
+
+    def _input_hash(self, plaintext: str, parameters: JSONDict) -> str:
+        return digest(plaintext, SYSTEM_PROMPT, PROMPT_TEMPLATE, RESPONSE_SCHEMA, parameters)
+
     @retry(max_retries=3)
     def _pull_model(self) -> None:
-        models = {m.model for m in ollama.list().models}
-        if self.model_id not in models:
+        if self.model_id not in _local_models():
             ollama.pull(self.model_id)
+            _local_models.cache_clear()
+
+    def _load_model(self, num_ctx: int) -> None:
+        """
+        Pulls the model if needed and loads it with an empty prompt and the context
+        window the requests will use, so they do not pay for the load. Reports how
+        long the load took, which is close to zero when the model was still loaded
+        from an earlier run.
+        """
+        self._pull_model()
+        with telemetry.span("Model Load", model=self.model_id, num_ctx=num_ctx) as span:
+            response = ollama.generate(
+                model=self.model_id,
+                prompt="",
+                options=self._options.model_copy(update={"num_ctx": num_ctx}),
+                keep_alive=self.keep_alive,
+            )
+            # durations reported by Ollama are in nanoseconds
+            load_ms = (response.load_duration or 0) / 1e6
+            span.update(load_ms=load_ms)
+        console.json("model", model_id=self.model_id, load_ms=round(load_ms, 1))
+
+    def _model_loaded(self) -> asyncio.Future[None]:
+        """
+        Starts loading the model on a worker thread with the run's context size,
+        unless it is already loading, and returns the pending load.
+        """
+        if self._model_ready is None:
+            self._model_ready = asyncio.ensure_future(
+                asyncio.to_thread(self._load_model, self._num_ctx)
+            )
+        return self._model_ready
+
+    def _unload_model(self) -> None:
+        try:
+            ollama.generate(model=self.model_id, prompt="", keep_alive=0)
+        except Exception as e:
+            # must not hide the outcome of the analysis
+            console.error(f"Could not unload {self.model_id}.", exception=e)
+        else:
+            console.log(f"Unloaded {self.model_id}.")
+
+    def _build_prompt(self, plaintext: str) -> str:
+        return PROMPT_TEMPLATE.format(
+            desc=self.desc,
+            date=self.date,
+            plaintext=plaintext,
+        )
+
+    def _read_document(self, f: Path) -> tuple[list[str], OffsetMap | None]:
+        """
+        Reads the pages of a plaintext file as they are sent to the model, cleaned
+        when enabled, along with the map from their offsets to the original text's.
+        """
+        pages = self._read_pages(f)
+        if cleanup := self._cleanup_settings:
+            return clean_pages(pages, cleanup)
+        return pages, None
+
+    def _chunk_pages(self, pages: list[str]) -> list[str]:
+        """
+        Packs pages into chunks that fit the context window alongside the prompt and
+        the response.
+        """
+        overhead = self._count_prompt_tokens(self._build_prompt(""))
+        budget = self._tokens.prompt_budget - overhead
+        return chunk_pages(
+            pages,
+            max(budget, 1),
+            overlap=self.chunk_overlap,
+            size=self._tokens.count,
+        )
+
+    def _size_context(self, prompts: Iter[str]) -> int:
+        """
+        Grows the run's context window to fit `prompts`. Ollama reloads the model
+        whenever `num_ctx` changes, so all requests of a run share one size (the
+        largest needed so far) rather than alternating between the sizes of their
+        own prompts.
+        """
+        needed = max(self._tokens.num_ctx(self._count_prompt_tokens(p)) for p in prompts)
+        self._num_ctx = max(self._num_ctx, needed)
+        return self._num_ctx
+
+    def _warm_up_context(
+        self, text_files: list[Path], manifest: RunManifest, parameters: JSONDict
+    ) -> int:
+        """
+        Sizes the context window to load the model with as the run starts, or returns
+        0 when no file needs analysis.
+
+        While plaintext is still being extracted its size is unknown, so the model is
+        loaded with the largest window a chunk can need and the run keeps that size;
+        the load then overlaps the whole extraction. When extraction is skipped, the
+        window fits the files whose results are out of date.
+        """
+        if not self._skip_extract:
+            full = self._tokens.num_ctx(self._tokens.prompt_budget)
+            self._num_ctx = max(self._num_ctx, full)
+            return self._num_ctx
+
+        prompts: list[str] = []
+        for f in text_files:
+            pages, _ = self._read_document(f)
+            input_hash = self._input_hash(PAGE_BREAK.join(pages), parameters)
+            out_file = self.results_dir / f"{f.stem}_analysis.json"
+            if self.force_analysis or not manifest.is_current(f.stem, input_hash, out_file):
+                prompts.extend(map(self._build_prompt, self._chunk_pages(pages)))
+        return self._size_context(prompts) if prompts else 0
+
+    @timings(disp_name="Generate Response")
+    async def _generate(self, client: ollama.AsyncClient, prompt: str) -> str:
+        await self._model_loaded()
+        async with self._request_slots:
+            # read only once a slot is free: queued requests must not send the size
+            # of the run from before another file grew it
+            num_ctx = self._num_ctx or self._size_context([prompt])
+            with telemetry.span("LLM Call", num_ctx=num_ctx) as span:
+                response = await client.generate(
+                    model=self.model_id,
+                    system=SYSTEM_PROMPT,
+                    format=RESPONSE_SCHEMA,
+                    prompt=prompt,
+                    options=self._options.model_copy(update={"num_ctx": num_ctx}),
+                    keep_alive=self.keep_alive,
+                )
+                # durations reported by Ollama are in nanoseconds
+                span.update(
+                    prompt_tokens=response.prompt_eval_count,
+                    eval_tokens=response.eval_count,
+                    load_ms=(response.load_duration or 0) / 1e6,
+                    prompt_eval_ms=(response.prompt_eval_duration or 0) / 1e6,
+                    eval_ms=(response.eval_duration or 0) / 1e6,
+                )
+
+        telemetry.count("llm_calls")
+        telemetry.count("prompt_tokens", response.prompt_eval_count or 0)
+        telemetry.count("eval_tokens", response.eval_count or 0)
+        return response.response
 
     @property
     def config(self) -> JSONDict:
         input_files: JSONList = [f.name for f in self.path.iterdir() if f.suffix == ".pdf"]
         return {
             "model_id": self.model_id,
+            "tokenizer": self._tokens.source,
             "input_files": input_files,
             "output_directory": self.results_dir.as_uri(),
             "accident_info": {
@@ -117,9 +331,7 @@ class Analyzer(Extractor):
 
         from .utils import track
 
-        self._pull_model()
-
-        text_files = self._extract_text()
+        text_files, extraction = self._stream_text()
 
         if not text_files:
             console.error(
@@ -127,72 +339,152 @@ class Analyzer(Extractor):
                 exception=FileNotFoundError,
             )
 
-        output_text: str = ""
         match_counts: dict[str, Any] = {}
 
+        results_dir = self.results_dir
+        manifest = RunManifest(results_dir)
+        parameters = self._parameters
+
         console.json(global_configuration=self.config)
 
-        for f in track(
-            iterable=text_files,
-            desc="analyzing medical records",
-        ):
-            plaintext = f.read_text(encoding="utf-8")
+        async def analyze_all() -> None:
+            """
+            Extracts plaintext and loads the model on worker threads while analyzing
+            each file as soon as its plaintext has been written.
+            """
+            loop = asyncio.get_running_loop()
+            ready: dict[Path, asyncio.Future[None]] = {
+                f: loop.create_future() for f in text_files
+            }
+            stop = threading.Event()
+
+            def settle(future: asyncio.Future[None], exc: BaseException | None = None) -> None:
+                if not future.done():
+                    future.set_exception(exc) if exc else future.set_result(None)
+
+            def extract() -> None:
+                try:
+                    for f in extraction:
+                        loop.call_soon_threadsafe(settle, ready[f])
+                        if stop.is_set():
+                            break
+                except BaseException as e:
+                    for future in ready.values():
+                        loop.call_soon_threadsafe(settle, future, e)
+                finally:
+                    extraction.close()
+
+            async def analyze_when_ready(f: Path) -> tuple[str, JSONSerializable]:
+                await ready[f]
+                with telemetry.span("Analyze File", file=f.stem):
+                    return await self._analyze_file(client, f, manifest, parameters)
+
+            self._request_slots = asyncio.Semaphore(max(1, self.parallel_requests))
+            self._model_ready = None
+            if self._warm_up_context(text_files, manifest, parameters):
+                self._model_loaded()
+            client = _async_client()
+            producer = asyncio.create_task(asyncio.to_thread(extract))
+            tasks = [asyncio.create_task(analyze_when_ready(f)) for f in text_files]
+            try:
+                for task in track(
+                    iterable=asyncio.as_completed(tasks),
+                    desc="analyzing medical records",
+                    total=len(tasks),
+                ):
+                    name, counts = await task
+                    match_counts[name] = counts
+            finally:
+                stop.set()
+                for task in tasks:
+                    task.cancel()
+                loading = [self._model_ready] if self._model_ready else []
+                await asyncio.gather(producer, *loading, return_exceptions=True)
+
+        self._num_ctx = 0
+        try:
+            with telemetry.span("Analyze", files=len(text_files)):
+                _runner().run(analyze_all())
+        finally:
+            if self.unload_model:
+                self._unload_model()
+        telemetry.flush()
 
-            prompt = PROMPT_TEMPLATE.format(
-                desc=self.desc,
-                date=self.date,
-                plaintext=plaintext,
-            )
+        console.json(match_counts=match_counts)
 
-            text_length: int = len(plaintext)
-            total_chars: int = text_length + PROMPT_LENGTH
+    async def _analyze_file(
+        self,
+        client: ollama.AsyncClient,
+        f: Path,
+        manifest: RunManifest,
+        parameters: JSONDict,
+    ) -> tuple[str, JSONSerializable]:
+        """
+        Analyzes a single plaintext file and writes its validated results, returning
+        the file's name and match counts.
+        """
+        pages, offsets = self._read_document(f)
+        plaintext = PAGE_BREAK.join(pages)
 
-            if math.ceil(total_chars / 4) > self.max_tokens:
-                console.error(
-                    f"Skipping analysis for {f.name}.",
-                    f"Text length ({text_length}) exceeded maximum allowed (max_tokens: {self.max_tokens}).",
-                )
-                continue
+        input_hash = self._input_hash(plaintext, parameters)
+        out_file = self.results_dir / f"{f.stem}_analysis.json"
 
-            console.json("current_file_info", text_length=text_length, prompt=prompt)
+        if not self.force_analysis and manifest.is_current(f.stem, input_hash, out_file):
+            console.log(
+                f"Skipping analysis for {f.name}.",
+                "Inputs are unchanged since the last analysis.",
+            )
+            return f.stem, manifest.get(f.stem, "match_counts")
 
-            try:
+        text_length: int = len(plaintext)
+        chunks = self._chunk_pages(pages)
+
+        if len(chunks) > 1:
+            console.log(
+                f"Splitting {f.name} into {len(chunks)} chunks.",
+                f"Text length ({text_length}) exceeded the prompt budget (max_tokens: {self.max_tokens}).",
+            )
 
-                @timings()
-                def generate_response() -> str:
-                    response = ollama.generate(
-                        model=self.model_id,
-                        system=SYSTEM_PROMPT,
-                        format=RESPONSE_SCHEMA,
-                        prompt=prompt,
-                        options=self._options,
-                        # keep alive for 1 hour
-                        keep_alive=3600,
-                    )
+        try:
+            prompts = [self._build_prompt(chunk) for chunk in chunks]
+            for chunk, prompt in zip(chunks, prompts):
+                console.json(
+                    "current_file_info",
+                    text_length=len(chunk),
+                    prompt_tokens=self._count_prompt_tokens(prompt),
+                    prompt=prompt,
+                )
 
-                    return response.response
+            self._size_context(prompts)
+            outputs = await asyncio.gather(*(self._generate(client, p) for p in prompts))
+            analysis_data = merge_results(json.loads(output) for output in outputs)
 
-                output_text = generate_response()
-                analysis_data: AnalysisResults = json.loads(output_text)
+            from .validate import ValidationDict
 
-                from .validate import ValidationDict
+            results, match_counts = ValidationDict(
+                plaintext,
+                analysis_data,
+                offsets=offsets,
+            ).validate()
 
-                results, match_counts[f.stem] = ValidationDict(
-                    plaintext, analysis_data
-                ).validate()
+            out_file.write_text(json.dumps(results, indent=4))
 
-                out_file = self.results_dir / f"{f.stem}_analysis.json"
-                out_file.write_text(json.dumps(results, indent=4))
+            manifest.update(
+                f.stem,
+                input_hash,
+                parameters=parameters,
+                match_counts=match_counts,
+            )
 
-            except json.JSONDecodeError as e:
-                console.error(f"Error parsing JSON from LLM for {f.name}.", exception=e)
-                raise e
+        except json.JSONDecodeError as e:
+            console.error(f"Error parsing JSON from LLM for {f.name}.", exception=e)
+            raise e
 
-            except Exception as e:
-                console.error(exception=e)
-                raise e
+        except Exception as e:
+            console.error(exception=e)
+            raise e
 
-        console.json(match_counts=match_counts)
+        return f.stem, match_counts
 
     @staticmethod
     def init_analysis_args(subparsers: Subparsers) -> None:
@@ -255,6 +547,126 @@ class Analyzer(Extractor):
             gooey_options={"default_path": DATA_DIR},
             type=Path,
         )
+        extraction = config.add_argument_group(
+            "Text Extraction",
+            description="Configure how plaintext is extracted from the PDF files.",
+        )
+        extraction.add_argument(
+            "--ocr_workers",
+            metavar="OCR Workers",
+            help="The number of processes used for optical character recognition. "
+            "Defaults to the number of CPU cores.",
+            widget="IntegerField",
+            gooey_options={"min": 1, "max": os.cpu_count() or 1},
+            default=os.cpu_count() or 1,
+            type=int,
+        )
+        extraction.add_argument(
+            "--native_text",
+            metavar="Use Native Text",
+            choices=[True, False],
+            default=True,
+            help="If set to True, pages that already contain selectable text are read "
+            "directly instead of being passed through OCR.",
+            type=argtype.boolstring,
+        )
+        extraction.add_argument(
+            "--ocr_cache",
+            metavar="Use OCR Cache",
+            choices=[True, False],
+            default=True,
+            help="If set to True, text extracted from previously seen pages is reused "
+            "so only new or changed pages are processed.",
+            type=argtype.boolstring,
+        )
+        extraction.add_argument(
+            "--ocr_language",
+            metavar="OCR Language",
+            help="The Tesseract language(s) to recognize, e.g. 'eng' or 'eng+spa'.",
+            default="eng",
+            type=str,
+        )
+        extraction.add_argument(
+            "--ocr_dpi",
+            metavar="OCR Resolution",
+            help="The resolution (in dpi) pages are rendered at before OCR. Higher "
+            "values help with small print but are much slower.",
+            widget="IntegerField",
+            gooey_options={"min": 72, "max": 600, "increment": 24},
+            default=72,
+            type=int,
+        )
+        extraction.add_argument(
+            "--ocr_full_page",
+            metavar="OCR Full Page",
+            choices=[True, False],
+            default=False,
+            help="If set to True, the whole page is passed through OCR instead of only "
+            "the regions without legible text.",
+            type=argtype.boolstring,
+        )
+        extraction.add_argument(
+            "--ocr_auto",
+            metavar="Automatic OCR Settings",
+            choices=[True, False],
+            default=False,
+            help="If set to True, each page is first read with fast, low resolution OCR "
+            "and only retried at higher resolution when the result falls short of the "
+            "quality target. Overrides the resolution and full page settings.",
+            type=argtype.boolstring,
+        )
+        extraction.add_argument(
+            "--ocr_quality_target",
+            metavar="OCR Quality Target",
+            help="The share of recognized characters that must form words for automatic "
+            "OCR to accept a result.",
+            widget="DecimalField",
+            gooey_options={"min": 0.0, "max": 1.0, "increment": 0.05},
+            default=0.6,
+            type=float,
+        )
+        extraction.add_argument(
+            "--drop_blank_pages",
+            metavar="Drop Blank Pages",
+            choices=[True, False],
+            default=True,
+            help="If set to True, pages without any text or markings are left empty "
+            "instead of being passed through OCR and analysis.",
+            type=argtype.boolstring,
+        )
+        extraction.add_argument(
+            "--drop_duplicate_pages",
+            metavar="Drop Duplicate Pages",
+            choices=[True, False],
+            default=True,
+            help="If set to True, pages that repeat an earlier page of the same file "
+            "(e.g. re-sent cover sheets) are left empty instead of being analyzed again.",
+            type=argtype.boolstring,
+        )
+        cleanup = config.add_argument_group(
+            "Text Cleanup",
+            description="Configure how plaintext is normalized before analysis.",
+        )
+        cleanup.add_argument(
+            "--clean_plaintext",
+            metavar="Clean Plaintext",
+            choices=[True, False],
+            default=True,
+            help="If set to True, stray OCR marks are dropped, hyphenated words are "
+            "rejoined and whitespace is collapsed before the plaintext is analyzed. "
+            "The plaintext files themselves are left unchanged.",
+            type=argtype.boolstring,
+        )
+        cleanup.add_argument(
+            "--min_alnum_ratio",
+            metavar="Minimum Alphanumeric Ratio",
+            help="The share of a line's characters that must be letters or digits "
+            "for the line to be kept during cleanup.",
+            widget="DecimalField",
+            gooey_options={"min": 0.0, "max": 1.0, "increment": 0.05},
+            default=0.5,
+            type=float,
+        )
         dev = parser.add_argument_group("Developer")
         dev.add_argument(
             "--debug",
@@ -264,6 +676,15 @@ class Analyzer(Extractor):
             help="If set to True, will print the program configuration and exit without execution.",
             type=argtype.boolstring,
         )
+        dev.add_argument(
+            "--force_analysis",
+            metavar="Force Analysis",
+            choices=[True, False],
+            default=False,
+            help="If set to True, will reanalyze every file even if its inputs are unchanged "
+            "since the last analysis.",
+            type=argtype.boolstring,
+        )
         llm_params = dev.add_argument_group(
             "LLM Parameters",
             description="Configure relevant parameters for the LLM. "
@@ -282,6 +703,43 @@ class Analyzer(Extractor):
             default=16000,
             type=int,
         )
+        llm_params.add_argument(
+            "--parallel_requests",
+            metavar="Parallel Requests",
+            help="The maximum number of requests sent to Ollama at once. Should not exceed "
+            "OLLAMA_NUM_PARALLEL, as each parallel slot allocates its own context.",
+            widget="IntegerField",
+            gooey_options={"min": 1, "max": 8},
+            default=2,
+            type=int,
+        )
+        llm_params.add_argument(
+            "--chunk_overlap",
+            metavar="Chunk Overlap",
+            help="The number of pages repeated between consecutive chunks when a file "
+            "is too long to analyze in a single request.",
+            widget="IntegerField",
+            gooey_options={"min": 0, "max": 5},
+            default=1,
+            type=int,
+        )
+        llm_params.add_argument(
+            "--keep_alive",
+            metavar="Keep Alive",
+            help="How long Ollama keeps the model loaded after its last request, e.g. "
+            "'30m' or '2h'. '-1' keeps it loaded until Ollama stops.",
+            gooey_options={"initial_value": "60m"},
+            type=argtype.duration,
+        )
+        llm_params.add_argument(
+            "--unload_model",
+            metavar="Unload Model",
+            choices=[True, False],
+            default=False,
+            help="If set to True, the model is unloaded as soon as analysis finishes, "
+            "freeing its memory regardless of the keep alive setting.",
+            type=argtype.boolstring,
+        )
         llm_params.add_argument(
             "--model_id",
             metavar="Model Id",
@@ -0,0 +1,367 @@
+"""
+Throughput benchmark for the extract -> analyze -> validate pipeline.
+
+Runs over copies of the sample records in `data/` with Ollama replaced by a local
+stub server that answers with canned JSON, and prints machine-readable results:
+
+    python -m src.bench --output bench.json
+"""
+
+from __future__ import annotations
+
+from .utils import DATA_DIR, ROOT_DIR
+from .tokens import estimate_tokens
+from .chunk import PAGE_BREAK
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import datetime as dt
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+_RECORD_MARKER = typing.final("Medical Record Text:")
+
+# how long `import src.program` may take in a fresh interpreter; wx, Gooey, fitz and
+# ollama must stay out of it (they are loaded by the GUI or on first use)
+IMPORT_BUDGET_MS = typing.final(250.0)
+
+
+def peak_rss() -> JSONDict:
+    """Peak resident set size in MiB of this process and of its (waited for) children."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters),
+            counters.cb,
+        )
+        # worker processes are not accounted for on Windows
+        return {"self": round(counters.PeakWorkingSetSize / 2**20, 1), "children": None}
+
+    import resource
+
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        who: round(resource.getrusage(flag).ru_maxrss * unit / 2**20, 1)
+        for who, flag in (
+            ("self", resource.RUSAGE_SELF),
+            ("children", resource.RUSAGE_CHILDREN),
+        )
+    }
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    A stand-in for the Ollama HTTP API that answers `generate` requests with phrases
+    sampled from the prompt's record text (so validation has real matches to find)
+    after an optional fixed `latency`.
+    """
+
+    model_id: str
+    latency: float
+    requests: int
+    prompt_tokens: int
+
+    def __init__(self, model_id: str, latency: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.model_id = model_id
+        self.latency = latency
+        self.requests = 0
+        self.prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> typing.Self:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def generate(self, request: JSONDict) -> JSONDict:
+        prompt = str(request.get("prompt", ""))
+        tokens = estimate_tokens(str(request.get("system", ""))) + estimate_tokens(prompt)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += tokens
+        sleep(self.latency)
+
+        words = prompt.partition(_RECORD_MARKER)[2].split()
+        rng = random.Random(len(prompt))
+
+        def phrases(n: int) -> list[str]:
+            if len(words) < 3:
+                return []
+            starts = (rng.randrange(len(words) - 2) for _ in range(n))
+            return [" ".join(words[i : i + 3]) for i in starts]
+
+        response = {
+            "injuries": [*phrases(4), "whiplash"],
+            "treatments": [*phrases(4), "physical therapy"],
+        }
+        return {
+            "model": self.model_id,
+            "created_at": dt.datetime.now(dt.UTC).isoformat(),
+            "response": json.dumps(response),
+            "done": True,
+            "done_reason": "stop",
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    @property
+    def stub(self) -> StubOllama:
+        return typing.cast(StubOllama, self.server)
+
+    def _reply(self, payload: JSONDict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._reply({
+                "models": [{"model": self.stub.model_id, "name": self.stub.model_id}]
+            })
+        else:
+            self.send_error(404)
+
+    def do_POST(self) -> None:
+        request = json.loads(
+            self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}"
+        )
+        match self.path:
+            case "/api/generate":
+                self._reply(self.stub.generate(request))
+            case "/api/pull":
+                self._reply({"status": "success"})
+            case _:
+                self.send_error(404)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+
+def _commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def import_time(module: str = "src.program") -> float:
+    """Milliseconds a fresh interpreter takes to import `module`, per `-X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # lines read "import time: <self us> | <cumulative us> | <indented module name>"
+    for line in result.stderr.splitlines():
+        if line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return round(int(cumulative) / 1000, 1)
+    raise RuntimeError(f"{module} was not imported")
+
+
+def _rate(count: float, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+def _copy_records(source: Path, target: Path) -> list[Path]:
+    """Copies every input PDF under `source` into `target`, flattening the folder tree."""
+    copies = []
+    for pdf in sorted(source.rglob("*.pdf")):
+        copy = target / "_".join(pdf.relative_to(source).parts)
+        shutil.copy(pdf, copy)
+        copies.append(copy)
+    return copies
+
+
+def run(
+    data: Path,
+    *,
+    ocr_workers: int | None = None,
+    latency: float = 0.0,
+    rounds: int = 5,
+    model_id: str = "gemma3n:e4b",
+) -> JSONDict:
+    """Runs every pipeline stage once over copies of the PDFs under `data`."""
+    import fitz
+
+    startup_ms = import_time()
+
+    with StubOllama(model_id, latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        # the module-level ollama client reads the host on import
+        os.environ["OLLAMA_HOST"] = stub.url
+        from .analyze import Analyzer
+        from .validate import ValidationDict, load_analysis_results
+
+        pdfs = _copy_records(data, Path(tmp))
+        pages = 0
+        for pdf in pdfs:
+            with fitz.open(pdf) as doc:
+                pages += doc.page_count
+
+        analyzer = Analyzer()
+        analyzer.path = Path(tmp)
+        analyzer.desc = "Rear-end motor vehicle collision."
+        analyzer.date = dt.date.today()
+        analyzer.model_id = model_id
+        analyzer.ocr_workers = ocr_workers
+        analyzer.ocr_cache = False
+        analyzer.force_analysis = True
+
+        start = perf_counter()
+        text_files = analyzer._extract_text()
+        extract_seconds = perf_counter() - start
+        extract_rss = peak_rss()
+
+        # reuse the plaintext written above rather than extracting it again
+        analyzer._skip_extract = True
+        start = perf_counter()
+        Analyzer.analyze(analyzer)
+        analyze_seconds = perf_counter() - start
+        analyze_rss = peak_rss()
+
+        documents = []
+        for text_file in text_files:
+            out_file = analyzer.results_dir / f"{text_file.stem}_analysis.json"
+            text, offsets = analyzer._read_document(text_file)
+            plaintext = PAGE_BREAK.join(text)
+            documents.append((plaintext, offsets, load_analysis_results(out_file)))
+
+        items = 0
+        start = perf_counter()
+        for _ in range(rounds):
+            for plaintext, offsets, results in documents:
+                ValidationDict(plaintext, results, offsets=offsets).validate()
+                items += sum(len(results[subj]) for subj in ValidationDict._subjects)
+        validate_seconds = perf_counter() - start
+
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "startup": {
+            "import_ms": startup_ms,
+            "budget_ms": IMPORT_BUDGET_MS,
+            "within_budget": startup_ms <= IMPORT_BUDGET_MS,
+        },
+        "files": len(pdfs),
+        "pages": pages,
+        "extract": {
+            "seconds": round(extract_seconds, 3),
+            "pages_per_sec": _rate(pages, extract_seconds),
+            "peak_rss_mib": extract_rss,
+        },
+        "analyze": {
+            "seconds": round(analyze_seconds, 3),
+            "requests": stub.requests,
+            "prompt_tokens": stub.prompt_tokens,
+            "tokens_per_sec": _rate(stub.prompt_tokens, analyze_seconds),
+            "stub_latency": latency,
+            "peak_rss_mib": analyze_rss,
+        },
+        "validate": {
+            "seconds": round(validate_seconds, 3),
+            "rounds": rounds,
+            "items": items,
+            "items_per_sec": _rate(items, validate_seconds),
+        },
+        "peak_rss_mib": peak_rss(),
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.bench",
+        description="Benchmark text extraction, analysis and validation on sample records.",
+    )
+    parser.add_argument(
+        "--data", type=Path, default=Path(DATA_DIR), help="Folder of PDF files."
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this file.")
+    parser.add_argument("--ocr_workers", type=int, help="Processes used for OCR.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stub server waits before answering each request.",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=5,
+        help="How many times validation is repeated over every document.",
+    )
+    parser.add_argument("--model_id", default="gemma3n:e4b", help="The model id to report.")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.data,
+        ocr_workers=args.ocr_workers,
+        latency=args.latency,
+        rounds=args.rounds,
+        model_id=args.model_id,
+    )
+    text = json.dumps(results, indent=4)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
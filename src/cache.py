@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from .utils import ROOT_DIR
+
+import os
+import json
+import hashlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+CACHE_DIR = ROOT_DIR / ".cache"
+
+
+def page_hash(page: Page, *salt: object) -> str:
+    """
+    Hashes everything that determines the extracted text of a page: its content
+    streams, the raw streams of the images and form XObjects it draws, its geometry,
+    and any `salt` (e.g. the extraction settings).
+    """
+    doc = typing.cast("Document", page.parent)
+    digest = hashlib.sha256(page.read_contents())
+    for xref, *_ in (*page.get_images(full=True), *page.get_xobjects()):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    for font in page.get_fonts(full=True):
+        digest.update(repr(font[1:]).encode())
+    digest.update(repr((page.rotation, tuple(page.rect), *salt)).encode())
+    return digest.hexdigest()
+
+
+def salted_key(key: str, *salt: object) -> str:
+    """Derives a cache key from a `page_hash` computed without `salt`."""
+    return hashlib.sha256(repr((key, *salt)).encode()).hexdigest()
+
+
+class PageCache:
+    """
+    A content-addressed, on-disk store of extracted page text.
+
+    Entries are written atomically so that concurrent workers can share one cache.
+    """
+
+    root: Path
+
+    def __init__(self, root: Path | None = None) -> None:
+        self.root = root or CACHE_DIR / "pages"
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> JSONDict | None:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, key: str, value: JSONDict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(value), encoding="utf-8")
+        os.replace(tmp, path)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import re
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+PAGE_BREAK = typing.final(chr(12))
+
+
+def _split_oversized(page: str, budget: int, size: Callable[[str], int]) -> list[str]:
+    """Splits a single page that exceeds `budget` on line boundaries."""
+    parts: list[str] = []
+    current = ""
+    for line in page.splitlines(keepends=True):
+        while size(line) > budget:
+            # a single line larger than the whole budget is cut by characters
+            cut = max(1, len(line) * budget // size(line))
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:cut])
+            line = line[cut:]
+        if current and size(current + line) > budget:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def chunk_pages(
+    pages: Sequence[str],
+    budget: int,
+    *,
+    overlap: int = 1,
+    size: Callable[[str], int] = len,
+) -> list[str]:
+    """
+    Packs `pages` into form feed separated chunks whose `size` does not exceed
+    `budget`.
+
+    Each chunk after the first starts with up to `overlap` trailing pages of the
+    previous chunk, so that findings spanning a page boundary are seen whole at
+    least once. Pages that do not fit the budget on their own are split by lines.
+    """
+    pages = [
+        part
+        for page in pages
+        for part in (_split_oversized(page, budget, size) if size(page) > budget else [page])
+    ]
+    if len(pages) == 1:
+        return pages
+
+    # sizes are summed per page rather than measured on the joined text, which
+    # keeps tokenizer-backed `size` functions linear in the document length
+    sizes = [size(page) for page in pages]
+    sep = size(PAGE_BREAK)
+
+    def fits(indices: list[int], extra: int) -> bool:
+        return sum(sizes[i] + sep for i in indices) + sizes[extra] <= budget
+
+    chunks: list[list[int]] = []
+    current: list[int] = []
+    fresh = 0  # pages in `current` not already sent with the previous chunk
+
+    for i in range(len(pages)):
+        if fresh and not fits(current, i):
+            chunks.append(current)
+            current = current[-overlap:] if overlap > 0 else []
+            while current and not fits(current, i):
+                current.pop(0)
+            fresh = 0
+        current.append(i)
+        fresh += 1
+
+    if fresh:
+        chunks.append(current)
+
+    return [PAGE_BREAK.join(pages[i] for i in chunk) for chunk in chunks]
+
+
+def _normalize_item(item: str) -> str:
+    return re.sub(r"\W+", " ", item).strip().casefold()
+
+
+def merge_results(results: Iter[AnalysisResults]) -> AnalysisResults:
+    """
+    Merges the `injuries` and `treatments` of several partial analyses, dropping
+    items that only differ in case, punctuation or whitespace.
+    """
+    merged: AnalysisResults = {"injuries": [], "treatments": []}
+    seen: dict[str, set[str]] = {subj: set() for subj in merged}
+    for result in results:
+        for subj, items in merged.items():
+            for item in result.get(subj, ()):
+                if (key := _normalize_item(str(item))) and key not in seen[subj]:
+                    seen[subj].add(key)
+                    items.append(item)
+    return merged
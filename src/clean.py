@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from .chunk import PAGE_BREAK
+from bisect import bisect_right
+
+import re
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+_SPACE_RE = typing.final(re.compile(r"[^\S\n\f]+"))
+_ALNUM_RUN_RE = typing.final(re.compile(r"[^\W_]+"))
+_HYPHENATED_RE = typing.final(re.compile(r"[^\W\d_]-$"))
+
+
+class CleanupSettings(typing.NamedTuple):
+    collapse_whitespace: bool = True
+    dehyphenate: bool = True
+    # lines are dropped unless they hold a digit or a letter run of at least
+    # `min_run_length` and at least `min_alnum_ratio` of their characters are
+    # letters or digits, which removes stray OCR marks like "\" or "~ ; ‘" while
+    # keeping terse clinical lines like "ER", "L4-5" or measurements like "7.2"
+    min_run_length: int = 2
+    min_alnum_ratio: float = 0.5
+
+
+class OffsetMap:
+    """
+    Maps character offsets in cleaned text back to offsets in the text it was
+    cleaned from.
+
+    The cleaned text is stored as runs copied from the original; an offset inside
+    a run maps to the same position in the original run.
+    """
+
+    _clean: list[int]
+    _orig: list[int]
+
+    def __init__(self) -> None:
+        self._clean, self._orig = [], []
+
+    def add(self, clean: int, orig: int) -> None:
+        """Records that the cleaned text from `clean` on was copied from `orig`."""
+        if self._clean and self._orig[-1] - self._clean[-1] == orig - clean:
+            return
+        self._clean.append(clean)
+        self._orig.append(orig)
+
+    def __call__(self, offset: int) -> int:
+        if not self._clean:
+            return offset
+        k = max(0, bisect_right(self._clean, offset) - 1)
+        return self._orig[k] + offset - self._clean[k]
+
+    def span(self, start: int, end: int) -> tuple[int, int]:
+        """Maps a half-open span of cleaned text back to the original text."""
+        return self(start), self(end - 1) + 1 if end > start else self(start)
+
+
+class CleanText(typing.NamedTuple):
+    text: str
+    offsets: OffsetMap
+
+
+class CleanPages(typing.NamedTuple):
+    pages: list[str]
+    # offsets into the cleaned pages joined by form feeds
+    offsets: OffsetMap
+
+    @property
+    def text(self) -> str:
+        return PAGE_BREAK.join(self.pages)
+
+
+def keep_line(line: str, settings: CleanupSettings) -> bool:
+    chars = sum(not c.isspace() for c in line)
+    if not chars:
+        return False
+    runs = _ALNUM_RUN_RE.findall(line)
+    return (
+        max(map(len, runs), default=0) >= settings.min_run_length
+        or any(c.isdigit() for c in line)
+    ) and sum(map(len, runs)) / chars >= settings.min_alnum_ratio
+
+
+def clean_text(plaintext: str, settings: CleanupSettings | None = None) -> CleanText:
+    """
+    Normalizes extracted plaintext before it is sent to the model: drops lines of
+    OCR noise, joins words hyphenated across lines, and collapses runs of spaces
+    and blank lines. Form feeds are kept so page boundaries survive.
+
+    Returns the cleaned text along with a map from its offsets to `plaintext`'s.
+    """
+    cleaned = clean_pages(plaintext.split(PAGE_BREAK), settings)
+    return CleanText(cleaned.text, cleaned.offsets)
+
+
+def clean_pages(pages: Iter[str], settings: CleanupSettings | None = None) -> CleanPages:
+    """
+    Cleans each of `pages` like `clean_text`, for callers that already hold a
+    document page by page. The offsets map from the cleaned pages joined by form
+    feeds to the original pages joined the same way.
+    """
+    settings = settings or CleanupSettings()
+    cleaned: list[str] = []
+    parts: list[str] = []
+    offsets = OffsetMap()
+    length = 0
+
+    def emit(text: str, orig: int) -> None:
+        nonlocal length
+        if not text:
+            return
+        offsets.add(length, orig)
+        parts.append(text)
+        length += len(text)
+
+    pos = 0
+    for page_no, page in enumerate(pages):
+        if page_no:
+            cleaned.append("".join(parts))
+            parts.clear()
+            # the form feed itself only exists in the joined text
+            offsets.add(length, pos - 1)
+            length += len(PAGE_BREAK)
+
+        # (offset, line) pairs that survive filtering, blank lines as empty strings
+        lines: list[tuple[int, str]] = []
+        start = pos
+        for line in page.split("\n"):
+            if keep_line(line, settings):
+                lines.append((start, line))
+            elif not line.strip():
+                if not (settings.collapse_whitespace and lines and not lines[-1][1]):
+                    lines.append((start, ""))
+            start += len(line) + 1
+        pos += len(page) + 1
+
+        if settings.collapse_whitespace:
+            while lines and not lines[0][1]:
+                lines.pop(0)
+            while lines and not lines[-1][1]:
+                lines.pop()
+
+        for i, (start, line) in enumerate(lines):
+            if settings.collapse_whitespace:
+                lead = len(line) - len(line.lstrip())
+                start, line = start + lead, line.strip()
+
+            following = lines[i + 1] if i + 1 < len(lines) else None
+            joined = (
+                settings.dehyphenate
+                and following is not None
+                and bool(line)
+                and bool(_HYPHENATED_RE.search(line.rstrip()))
+                and following[1].lstrip()[:1].islower()
+            )
+            if joined:
+                line = line.rstrip()[:-1]
+
+            if settings.collapse_whitespace:
+                cursor = 0
+                for m in _SPACE_RE.finditer(line):
+                    emit(line[cursor : m.start()], start + cursor)
+                    # the single space stands in for the whole run
+                    emit(" ", start + m.start())
+                    cursor = m.end()
+                emit(line[cursor:], start + cursor)
+            else:
+                emit(line, start)
+
+            if not joined and i + 1 < len(lines):
+                emit("\n", start + len(line))
+
+    cleaned.append("".join(parts))
+    return CleanPages(cleaned, offsets)
@@ -0,0 +1,452 @@
+"""
+Long-lived worker service that runs analyze and preprocess jobs from a persistent
+priority queue, so the Ollama client, tokenizers and imported modules stay warm
+between runs and several people can submit folders at once:
+
+    python -m src.daemon serve
+    python -m src.daemon submit --priority 5 -- analyze --path data/doe_jane ...
+    python -m src.daemon status [<job id>]
+    python -m src.daemon cancel <job id>
+
+Jobs take the same options as `python -m src`. Relative paths are resolved against
+the working directory of the service, not of the client.
+
+Jobs can delete and overwrite files, so every request must carry the token the
+service writes to `.cache/daemon/token` (readable only by the user running it), and
+requests made by web pages (which carry an `Origin` header) are refused.
+"""
+
+from __future__ import annotations
+
+from .utils import LOG_DIR, console
+from .cache import CACHE_DIR
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, time as now
+
+import os
+import sys
+import hmac
+import json
+import shutil
+import sqlite3
+import secrets
+import argparse
+import threading
+import traceback
+import urllib.error
+import urllib.request
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+HOST = typing.final("127.0.0.1")
+PORT = typing.final(8765)
+
+TOKEN_FILE = typing.final(CACHE_DIR / "daemon" / "token")
+
+type JobState = Literal["queued", "running", "done", "failed", "cancelled"]
+
+_SCHEMA = typing.final("""
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    argv TEXT NOT NULL,
+    overwrite INTEGER NOT NULL DEFAULT 0,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    log TEXT
+)
+""")
+
+
+class Job(typing.NamedTuple):
+    id: int
+    priority: int
+    state: JobState
+    argv: list[str]
+    overwrite: bool
+    submitted: float
+    started: float | None
+    finished: float | None
+    error: str | None
+    log: str | None
+
+    @classmethod
+    def from_row(cls, row: tuple[Any, ...]) -> Job:
+        job = cls(*row)
+        return job._replace(argv=json.loads(row[3]), overwrite=bool(job.overwrite))
+
+    def to_json(self) -> JSONDict:
+        return typing.cast("JSONDict", self._asdict())
+
+
+_SELECT = typing.final(f"SELECT {', '.join(Job._fields)} FROM jobs")
+
+
+class JobQueue:
+    """
+    Jobs kept in a SQLite file so they survive restarts. The next job is the queued
+    one with the highest priority, oldest first among equals. Jobs that were running
+    when the service stopped are queued again on start.
+    """
+
+    FILE = typing.final(CACHE_DIR / "daemon" / "jobs.sqlite3")
+
+    file: Path
+
+    _conn: sqlite3.Connection
+
+    def __init__(self, file: Path = FILE) -> None:
+        self.file = file
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        # shared by the request handler threads and the worker, serialized by the lock
+        self._conn = sqlite3.connect(self.file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def submit(
+        self, argv: Sequence[str], *, priority: int = 0, overwrite: bool = False
+    ) -> int:
+        with self._ready:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (priority, argv, overwrite, submitted) VALUES (?, ?, ?, ?)",
+                (int(priority), json.dumps(list(argv)), int(overwrite), now()),
+            )
+            self._ready.notify()
+        return typing.cast(int, cursor.lastrowid)
+
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            row = self._conn.execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def jobs(self, state: JobState | None = None) -> list[Job]:
+        """All jobs, or those in `state`, in the order they run (or ran) in."""
+        query, params = _SELECT, ()
+        if state:
+            query, params = f"{_SELECT} WHERE state = ?", (state,)
+        with self._lock:
+            rows = self._conn.execute(f"{query} ORDER BY priority DESC, id", params).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancels a job that has not started yet."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+                (now(), job_id),
+            )
+        return cursor.rowcount > 0
+
+    def take(self, timeout: float | None = None) -> Job | None:
+        """Marks the next queued job as running and returns it, waiting up to `timeout`."""
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._ready:
+            while True:
+                row = self._conn.execute(
+                    f"{_SELECT} WHERE state = 'queued' ORDER BY priority DESC, id LIMIT 1"
+                ).fetchone()
+                if row:
+                    job = Job.from_row(row)._replace(state="running", started=now())
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, started = ? WHERE id = ?",
+                        (job.state, job.started, job.id),
+                    )
+                    return job
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._ready.wait(remaining)
+
+    def finish(
+        self, job_id: int, *, error: str | None = None, log: Path | None = None
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, finished = ?, error = ?, log = ? WHERE id = ?",
+                ("failed" if error else "done", now(), error, log and str(log), job_id),
+            )
+
+
+class Worker(threading.Thread):
+    """
+    Runs queued jobs one at a time in this process. Jobs share the Ollama server,
+    the execution log and the trace file, so running them side by side would only
+    make them compete; a queue keeps each run's log intact instead.
+    """
+
+    queue: JobQueue
+
+    def __init__(self, queue: JobQueue) -> None:
+        super().__init__(name="job-worker", daemon=True)
+        self.queue = queue
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            if job := self.queue.take(timeout=1.0):
+                self.run_job(job)
+
+    def run_job(self, job: Job) -> None:
+        from .program import HeadlessParser, Program
+
+        error = None
+        parser = Program.build_parser(HeadlessParser(prog="job", exit_on_error=False))
+        console.auto_confirm = job.overwrite
+        try:
+            program = parser.parse_args(job.argv, namespace=Program())
+            if not program.command:
+                raise ValueError("a command is required")
+            program.invoke()
+        # argparse and `dumplocals` end a failed run with SystemExit, which must not
+        # end the service
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            error = "".join(traceback.format_exception_only(e)).strip() or repr(e)
+        finally:
+            console.auto_confirm = None
+
+        console.writer().flush()
+        log = LOG_DIR / f"job_{job.id}.log"
+        if console.FILE.exists():
+            shutil.copyfile(console.FILE, log)
+        self.queue.finish(job.id, error=error, log=log if log.exists() else None)
+
+
+def write_token(file: Path = TOKEN_FILE) -> str:
+    """Writes a new random access token to `file`, readable only by its owner."""
+    token = secrets.token_urlsafe(32)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.unlink(missing_ok=True)
+    fd = os.open(file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        out.write(token)
+    return token
+
+
+def read_token(file: Path = TOKEN_FILE) -> str:
+    try:
+        return file.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        raise SystemExit(f"No access token at '{file}'. Is the service running?")
+
+
+class JobServer(ThreadingHTTPServer):
+    """
+    HTTP front end of the queue, bound to the loopback interface:
+
+    - `GET /health`
+    - `GET /jobs`, `GET /jobs/<id>`
+    - `POST /jobs` with `{"argv": [...], "priority": 0, "overwrite": false}`
+    - `POST /jobs/<id>/cancel`
+
+    Every request except `/health` needs an `Authorization: Bearer <token>` header,
+    and request bodies must be `application/json`, which browsers cannot send to
+    another origin without a CORS preflight (never answered here).
+    """
+
+    queue: JobQueue
+    token: str
+
+    def __init__(
+        self, queue: JobQueue, token: str, host: str = HOST, port: int = PORT
+    ) -> None:
+        super().__init__((host, port), _JobHandler)
+        self.queue = queue
+        self.token = token
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    @property
+    def jobs(self) -> JobQueue:
+        return typing.cast(JobServer, self.server).queue
+
+    def _reply(self, payload: JSONDict | list[JSONDict], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self, part: str) -> int | None:
+        return int(part) if part.isdigit() else None
+
+    def _refused(self, route: list[str]) -> bool:
+        """Replies with an error and returns True unless the request may proceed."""
+        if "Origin" in self.headers:
+            self._reply({"error": "requests from web pages are not accepted"}, 403)
+            return True
+        if route == ["health"]:
+            return False
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        expected = typing.cast(JobServer, self.server).token
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip(), expected):
+            self._reply({"error": "missing or invalid access token"}, 401)
+            return True
+        if self.command == "POST" and self.headers.get_content_type() != "application/json":
+            self._reply({"error": "the request body must be application/json"}, 415)
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        route = self.path.strip("/").split("/")
+        if self._refused(route):
+            return
+        match route:
+            case ["health"]:
+                self._reply({"status": "ok", "queued": len(self.jobs.jobs("queued"))})
+            case ["jobs"]:
+                self._reply([job.to_json() for job in self.jobs.jobs()])
+            case ["jobs", part] if (job_id := self._job_id(part)) is not None:
+                if job := self.jobs.get(job_id):
+                    self._reply(job.to_json())
+                else:
+                    self._reply({"error": f"no job {job_id}"}, 404)
+            case _:
+                self._reply({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        route = self.path.strip("/").split("/")
+        if self._refused(route):
+            return
+        match route:
+            case ["jobs"]:
+                try:
+                    request = json.loads(
+                        self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}"
+                    )
+                    argv = request["argv"]
+                    if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+                        raise TypeError("argv must be a list of strings")
+                    priority = int(request.get("priority", 0))
+                except (ValueError, KeyError, TypeError) as e:
+                    self._reply({"error": f"invalid job: {e!r}"}, 400)
+                    return
+                job_id = self.jobs.submit(
+                    argv, priority=priority, overwrite=bool(request.get("overwrite"))
+                )
+                if job := self.jobs.get(job_id):
+                    self._reply(job.to_json(), 201)
+            case ["jobs", part, "cancel"] if (job_id := self._job_id(part)) is not None:
+                if self.jobs.cancel(job_id) and (job := self.jobs.get(job_id)):
+                    self._reply(job.to_json())
+                else:
+                    self._reply({"error": f"job {job_id} is not queued"}, 409)
+            case _:
+                self._reply({"error": "not found"}, 404)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(host: str = HOST, port: int = PORT) -> None:
+    queue = JobQueue()
+    worker = Worker(queue)
+    worker.start()
+    with JobServer(queue, write_token(), host, port) as server:
+        print(f"Serving jobs on http://{host}:{port}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    TOKEN_FILE.unlink(missing_ok=True)
+    worker.stop()
+    worker.join()
+    queue.close()
+
+
+def request(
+    method: str,
+    path: str,
+    payload: JSONDict | None = None,
+    *,
+    host: str = HOST,
+    port: int = PORT,
+) -> JSONSerializable:
+    """Calls the service, returning the decoded JSON reply (errors included)."""
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(
+        f"http://{host}:{port}{path}",
+        data=data,
+        method=method,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {read_token()}",
+        },
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.daemon",
+        description="Run analysis jobs from a persistent queue, or talk to the service that does.",
+    )
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    commands = parser.add_subparsers(dest="action", required=True)
+    commands.add_parser("serve", help="Start the service.")
+    submit = commands.add_parser(
+        "submit", help="Queue a job with the options of `python -m src`."
+    )
+    submit.add_argument("--priority", type=int, default=0, help="Higher runs first.")
+    submit.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Answer yes when the job asks to overwrite existing files (default: no).",
+    )
+    submit.add_argument("job", nargs=argparse.REMAINDER)
+    status = commands.add_parser("status", help="Show all jobs, or one.")
+    status.add_argument("id", type=int, nargs="?")
+    cancel = commands.add_parser("cancel", help="Cancel a job that has not started.")
+    cancel.add_argument("id", type=int)
+    args = parser.parse_args(argv)
+
+    address = {"host": args.host, "port": args.port}
+    if args.action == "serve":
+        serve(**address)
+        return
+    if args.action == "submit":
+        job = args.job[1:] if args.job[:1] == ["--"] else args.job
+        reply = request(
+            "POST",
+            "/jobs",
+            {"argv": job, "priority": args.priority, "overwrite": args.overwrite},
+            **address,
+        )
+    elif args.action == "status":
+        reply = request("GET", "/jobs" if args.id is None else f"/jobs/{args.id}", **address)
+    else:
+        reply = request("POST", f"/jobs/{args.id}/cancel", **address)
+    print(json.dumps(reply, indent=4))
+    if isinstance(reply, dict) and "error" in reply:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
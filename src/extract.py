@@ -1,8 +1,13 @@
 from __future__ import annotations
 from src.utils import track, console
+from src.telemetry import telemetry
 from src.typeshed import JSONDict
+from src.ocr import OCREngine, OCRSettings, PageFilter, PageText
+from src.cache import PageCache
+from src.pagestore import PageStore
+from src.manifest import RunManifest
+from src.chunk import PAGE_BREAK
 
-import fitz
 import typing
 
 if typing.TYPE_CHECKING:
@@ -20,6 +25,35 @@ class Extractor:
     _skip_extract: bool = False
     _total_files: int
 
+    ocr_workers: int | None = None
+    native_text: bool = True
+    ocr_cache: bool = True
+    ocr_language: str = "eng"
+    ocr_dpi: int = 72
+    ocr_full_page: bool = False
+    ocr_auto: bool = False
+    ocr_quality_target: float = 0.6
+    drop_blank_pages: bool = True
+    drop_duplicate_pages: bool = True
+
+    @property
+    def _ocr_settings(self) -> OCRSettings:
+        return OCRSettings(
+            native_text=self.native_text,
+            ocr_language=self.ocr_language,
+            ocr_dpi=self.ocr_dpi,
+            ocr_full=self.ocr_full_page,
+            ocr_auto=self.ocr_auto,
+            min_ocr_quality=self.ocr_quality_target,
+        )
+
+    @property
+    def _page_filter(self) -> PageFilter:
+        return PageFilter(
+            drop_blank=self.drop_blank_pages,
+            drop_duplicates=self.drop_duplicate_pages,
+        )
+
     def set_total_files(self, total: int) -> None:
         self._total_files: int = total
         track.GLOBAL_TOTAL = total
@@ -54,17 +88,30 @@ class Extractor:
 
         return base_path or self.path / "".join(parts)
 
+    _directories: dict[str, Path]
+
     def _safe_get_directory(self, dirname: str, *, override: Path | None) -> Path:
-        path = (override or self.path) / dirname
+        if not hasattr(self, "_directories"):
+            self._directories = {}
+        elif dirname in self._directories:
+            return self._directories[dirname]
+        path = self._directories[dirname] = (override or self.path) / dirname
         if not path.exists():
             path.mkdir()
+        elif dirname == "analysis":
+            # results are only rewritten for files whose inputs changed (see
+            # `RunManifest`), which only holds for results the manifest knows about
+            known = RunManifest(path).entries
+            unknown = (
+                f
+                for f in path.glob("*_analysis.json")
+                if f.name.removesuffix("_analysis.json") not in known
+            )
+            if any(unknown) and not console.confirm(f"Overwrite existing files at '{path}'?"):
+                raise SystemExit
         elif any(path.iterdir()):
             if not console.confirm(f"Overwrite existing files at '{path}'?"):
-                match dirname:
-                    case "analysis":
-                        raise SystemExit
-                    case "plaintext":
-                        self._skip_extract = True
+                self._skip_extract = True
         return path
 
     custom_text_dir: Path | None = None
@@ -79,19 +126,50 @@ class Extractor:
     def results_dir(self) -> Path:
         return self._safe_get_directory("analysis", override=self.custom_results_dir)
 
-    def _process_textpage_chunk(
-        self,
-        textpages: Iter[TextPage],
-    ) -> str:
-        return chr(12).join(
-            textpage.extractText()
-            for textpage in track(
-                iterable=textpages,
-                desc="extracting plaintext",
-                total=self._total_files,
-            )
+    def _write_pages(self, store: PageStore, file: Path, pages: Iter[PageText]) -> JSONDict:
+        """
+        Stores the text of each page as soon as it is produced, exports the document's
+        `.txt` view to `file`, and returns how each page was extracted.
+        """
+        counts: dict[str, int] = dict.fromkeys(
+            ("native", "ocr", "cached", "blank", "duplicate", "tokens_saved"), 0
         )
 
+        def tally(pages: Iter[PageText]) -> Generator[PageText]:
+            for pno, page in enumerate(pages):
+                counts[page.method] += 1
+                counts["cached"] += page.cached
+                counts["tokens_saved"] += page.tokens_saved
+                telemetry.count(f"pages_{page.method}")
+                if page.timing:
+                    telemetry.complete(
+                        "Extract Page",
+                        page.timing.start,
+                        page.timing.end,
+                        pid=page.timing.pid,
+                        file=file.stem,
+                        page=pno,
+                        method=page.method,
+                        cached=page.cached,
+                    )
+                yield page
+
+        store.write(file.stem, tally(pages))
+        store.export(file.stem, file)
+        return typing.cast(JSONDict, counts)
+
+    def _read_pages(self, file: Path) -> list[str]:
+        """
+        Reads the pages of a document from the page store written by this run, or
+        from its `.txt` view when extraction was skipped (the files may have been
+        edited by hand since they were exported).
+        """
+        if not self._skip_extract:
+            with PageStore(file.parent) as store:
+                if file.stem in store:
+                    return [page.text for page in store.pages(file.stem)]
+        return file.read_text(encoding="utf-8").split(PAGE_BREAK)
+
     def _extract_text(self) -> list[Path]:
         """
         Extracts text from all PDF files in a given directory and saves it to
@@ -102,36 +180,65 @@ class Extractor:
             page_ranges (dict): The range arguments specifying the pages to include for each file. Defaults to (0, None, 1) for all files.
         """
 
+        text_files, extraction = self._stream_text()
+        for _ in extraction:
+            pass
+        return text_files
+
+    def _stream_text(self) -> tuple[list[Path], Generator[Path]]:
+        """
+        Plans the plaintext files for the PDF files in a given directory.
+
+        Returns the planned files and a lazy generator that performs the extraction,
+        yielding each plaintext file as soon as it has been written.
+        """
+
         self.path = self.path.resolve(strict=True)
 
         text_dir = self.text_dir
 
         if self._skip_extract:
-            text_files = [f for f in text_dir.iterdir() if f.suffix == ".txt" and f.is_file()]
+            text_files = sorted(
+                f for f in text_dir.iterdir() if f.suffix == ".txt" and f.is_file()
+            )
             self.set_total_files(len(text_files))
-            return text_files
+            return text_files, (f for f in text_files)
 
-        input_files = [f for f in self.path.iterdir() if f.suffix == ".pdf" and f.is_file()]
+        input_files = sorted(
+            f for f in self.path.iterdir() if f.suffix == ".pdf" and f.is_file()
+        )
         self.set_total_files(len(input_files))
 
-        chunk_generators = [
-            (fitz.utils.get_textpage_ocr(p) for p in pages)
-            for pages in track(
-                iterable=(fitz.open(f).pages() for f in input_files),
-                desc="running optical character recognition",
-            )
-        ]
-
         text_files = [text_dir / f"{f.stem}.txt" for f in input_files]
 
-        for f, text in track(
-            iterable=zip(
-                text_files,
-                (self._process_textpage_chunk(c) for c in chunk_generators),
-                strict=True,
-            ),
-            desc="extracting plaintexts",
-        ):
-            f.write_text(text, encoding="utf-8")
+        return text_files, self._write_text_files(input_files, text_files)
 
-        return text_files
+    def _write_text_files(
+        self,
+        input_files: list[Path],
+        text_files: list[Path],
+    ) -> Generator[Path]:
+        engine = OCREngine(
+            workers=self.ocr_workers,
+            settings=self._ocr_settings,
+            cache=PageCache() if self.ocr_cache else None,
+            page_filter=self._page_filter,
+        )
+
+        extraction_paths: JSONDict = {}
+
+        with PageStore(self.text_dir) as store:
+            for f, (_, pages) in track(
+                iterable=zip(
+                    text_files,
+                    engine.run(input_files),
+                    strict=True,
+                ),
+                desc="running optical character recognition",
+                total=len(text_files),
+            ):
+                with telemetry.span("Extract File", file=f.stem):
+                    extraction_paths[f.stem] = self._write_pages(store, f, pages)
+                yield f
+
+        console.json(extraction_paths=extraction_paths)
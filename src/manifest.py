@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+
+def digest(*parts: object) -> str:
+    """Hashes the JSON representation of `parts` into a stable hex digest."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RunManifest:
+    """
+    Records, per analyzed file, a digest of everything that went into its analysis
+    so that unchanged files can be skipped on later runs.
+    """
+
+    FILENAME = typing.final("manifest.json")
+
+    file: Path
+    entries: dict[str, JSONDict]
+
+    def __init__(self, directory: Path) -> None:
+        self.file = directory / self.FILENAME
+        try:
+            self.entries = json.loads(self.file.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def is_current(self, name: str, input_hash: str, out_file: Path) -> bool:
+        entry = self.entries.get(name)
+        return bool(entry) and entry["input_hash"] == input_hash and out_file.exists()
+
+    def get(self, name: str, key: str) -> JSONSerializable:
+        return self.entries.get(name, {}).get(key)
+
+    def update(self, name: str, input_hash: str, **kwds: JSONSerializable) -> None:
+        self.entries[name] = {"input_hash": input_hash, **kwds}
+        self.save()
+
+    def amend(self, name: str, **kwds: JSONSerializable) -> bool:
+        """Updates fields of an existing entry without changing its input hash."""
+        if name not in self.entries:
+            return False
+        self.entries[name].update(kwds)
+        return True
+
+    def save(self) -> None:
+        tmp = self.file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.entries, indent=4), encoding="utf-8")
+        os.replace(tmp, self.file)
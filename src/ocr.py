@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from time import perf_counter
+from .cache import PageCache, page_hash, salted_key
+from .tokens import estimate_tokens
+from .utils import lazy_import
+
+import os
+import hashlib
+import statistics
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+    import fitz
+else:
+    fitz = lazy_import("fitz")
+
+from pathlib import Path
+
+
+type ExtractionMethod = typing.Literal["native", "ocr", "blank", "duplicate"]
+
+
+# (dpi, full page) OCR passes tried in order by the auto mode, cheapest first
+OCR_LADDER = typing.final(((72, False), (150, False), (300, True)))
+
+
+class OCRSettings(typing.NamedTuple):
+    native_text: bool = True
+    min_native_chars: int = 32
+    min_native_quality: float = 0.6
+    # pages whose images cover more than this share keep their text layer but have
+    # the images OCR'd as well, e.g. a scanned summary between a printed header
+    # and footer; logos and signatures stay well below it
+    max_native_image_share: float = 0.1
+    ocr_language: str = "eng"
+    ocr_dpi: int = 72
+    ocr_full: bool = False
+    # when set, `ocr_dpi` and `ocr_full` are ignored in favor of `OCR_LADDER`
+    ocr_auto: bool = False
+    min_ocr_quality: float = 0.6
+
+
+class PageFilter(typing.NamedTuple):
+    drop_blank: bool = True
+    drop_duplicates: bool = True
+    # grayscale variance of the page rendered 128px on its long side; blank scans
+    # stay in the single digits while a page holding only a header is around 50
+    blank_variance: float = 10.0
+
+
+class Shard(typing.NamedTuple):
+    file: Path
+    pages: Sequence[int]
+    settings: OCRSettings
+    cache_root: Path | None
+    keys: Sequence[str] | None = None
+
+
+class PageScan(typing.NamedTuple):
+    key: str
+    variance: float
+    has_text: bool
+
+
+class Timing(typing.NamedTuple):
+    pid: int
+    start: float
+    end: float
+
+
+class PageText(typing.NamedTuple):
+    text: str
+    method: ExtractionMethod
+    cached: bool = False
+    tokens_saved: int = 0
+    # when and where the page was extracted, in `perf_counter` seconds
+    timing: Timing | None = None
+
+
+def text_quality(text: str) -> float:
+    """
+    Scores how much a text layer looks like language rather than artifacting, in [0,1].
+
+    The score is the share of non-whitespace characters that belong to words of at
+    least two letters, penalized by the share of replacement characters.
+    """
+    chars = sum(not c.isspace() for c in text)
+    if not chars:
+        return 0.0
+    wordy = sum(len(w) for w in text.split() if sum(c.isalpha() for c in w) >= 2)
+    garbled = text.count(chr(0xFFFD))
+    return max(0.0, (wordy - garbled) / chars)
+
+
+def has_text_layer(text: str, settings: OCRSettings) -> bool:
+    return (
+        len(text.strip()) >= settings.min_native_chars
+        and text_quality(text) >= settings.min_native_quality
+    )
+
+
+def image_coverage(page: Page) -> float:
+    """The share of `page` covered by its images, in [0,1]."""
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def pixel_variance(page: Page, size: int = 128) -> float:
+    """The grayscale variance of `page` rendered at `size` pixels on its long side."""
+    zoom = size / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    return statistics.pvariance(pix.samples)
+
+
+def _text_key(text: str) -> str | None:
+    normalized = " ".join(text.split()).casefold()
+    return hashlib.blake2b(normalized.encode("utf-8")).hexdigest() if normalized else None
+
+
+def _init_worker() -> None:
+    # tesseract spawns its own threads per page; with one page per process
+    # that only oversubscribes the cores the pool is already using
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _scan_shard(shard: Shard) -> list[PageScan]:
+    """Fingerprints a set of pages without extracting their text."""
+    with fitz.open(shard.file) as doc:
+        return [
+            PageScan(
+                key=page_hash(page := doc[pno]),
+                variance=pixel_variance(page),
+                has_text=bool(typing.cast(str, page.get_text()).strip()),
+            )
+            for pno in shard.pages
+        ]
+
+
+def _ocr_text(page: Page, language: str, dpi: int, full: bool) -> str:
+    textpage = fitz.utils.get_textpage_ocr(page, language=language, dpi=dpi, full=full)
+    text = textpage.extractText()
+    del textpage
+    return text
+
+
+def _auto_ocr_text(page: Page, settings: OCRSettings, partial: bool = False) -> str:
+    """
+    Runs the passes of `OCR_LADDER` until one reaches `min_ocr_quality`, returning
+    the best scoring text. Mostly-text scans usually stop at the first pass, which
+    is several times faster than a full page at 300 dpi. With `partial`, only the
+    passes that keep the page's text layer are run.
+    """
+    best, best_quality = "", -1.0
+    for dpi, full in OCR_LADDER:
+        if partial and full:
+            continue
+        text = _ocr_text(page, settings.ocr_language, dpi, full)
+        if (quality := text_quality(text)) > best_quality:
+            best, best_quality = text, quality
+        if quality >= settings.min_ocr_quality:
+            break
+    return best
+
+
+def _extract_page(page: Page, settings: OCRSettings) -> PageText:
+    if settings.native_text:
+        text = typing.cast(str, page.get_text())
+        if has_text_layer(text, settings):
+            if image_coverage(page) <= settings.max_native_image_share:
+                return PageText(text, "native")
+            # OCR only the image regions, keeping the text layer around them
+            if settings.ocr_auto:
+                return PageText(_auto_ocr_text(page, settings, partial=True), "ocr")
+            text = _ocr_text(page, settings.ocr_language, settings.ocr_dpi, False)
+            return PageText(text, "ocr")
+    if settings.ocr_auto:
+        return PageText(_auto_ocr_text(page, settings), "ocr")
+    text = _ocr_text(page, settings.ocr_language, settings.ocr_dpi, settings.ocr_full)
+    return PageText(text, "ocr")
+
+
+def _extract_cached_page(
+    page: Page,
+    settings: OCRSettings,
+    cache: PageCache,
+    key: str | None = None,
+) -> PageText:
+    key = salted_key(key or page_hash(page), *settings)
+    if entry := cache.get(key):
+        method = typing.cast(ExtractionMethod, entry["method"])
+        return PageText(str(entry["text"]), method, cached=True)
+    result = _extract_page(page, settings)
+    cache.set(key, {"text": result.text, "method": result.method})
+    return result
+
+
+def _ocr_shard(shard: Shard) -> list[PageText]:
+    """Extracts a set of pages using a private `fitz.Document`."""
+    cache = PageCache(shard.cache_root) if shard.cache_root else None
+    keys = shard.keys or [None] * len(shard.pages)
+    pid = os.getpid()
+    results = []
+    with fitz.open(shard.file) as doc:
+        for pno, key in zip(shard.pages, keys):
+            start = perf_counter()
+            page = (
+                _extract_cached_page(doc[pno], shard.settings, cache, key)
+                if cache
+                else _extract_page(doc[pno], shard.settings)
+            )
+            results.append(page._replace(timing=Timing(pid, start, perf_counter())))
+    return results
+
+
+class _Deferred[T]:
+    """Stands in for a `Future` when running without a pool; runs on first `result()`."""
+
+    def __init__(self, fn: Callable[[Shard], T], shard: Shard) -> None:
+        self._call = lambda: fn(shard)
+
+    def result(self) -> T:
+        if not hasattr(self, "_result"):
+            self._result = self._call()
+        return self._result
+
+
+class OCREngine:
+    """
+    Shards the pages of one or more PDF files across a pool of worker processes
+    and reassembles the extracted text in page order.
+
+    Pages with a usable native text layer are read directly; the rest are passed
+    through Tesseract. When a cache is given, pages whose content and settings were
+    seen before are served from it instead.
+
+    Before extraction, every page is fingerprinted so that blank pages and exact
+    repeats of an earlier page of the same document (re-sent fax covers, duplicated
+    scans) are never OCR'd; after extraction, pages whose text repeats an earlier
+    page's are dropped as well. Documents are analyzed separately, so a page is
+    never dropped for appearing in another document. Dropped pages are kept as
+    empty pages so that page numbers and form feeds still line up with the source
+    document.
+    """
+
+    workers: int
+    shard_size: int
+    settings: OCRSettings
+    page_filter: PageFilter
+    cache: PageCache | None
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        shard_size: int = 4,
+        settings: OCRSettings | None = None,
+        cache: PageCache | None = None,
+        page_filter: PageFilter | None = None,
+    ) -> None:
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.shard_size = max(1, shard_size)
+        self.settings = settings or OCRSettings()
+        self.cache = cache
+        self.page_filter = page_filter or PageFilter()
+
+    @property
+    def _filtering(self) -> bool:
+        return self.page_filter.drop_blank or self.page_filter.drop_duplicates
+
+    def _shards(
+        self,
+        file: Path,
+        pages: Sequence[int],
+        keys: Sequence[str] | None = None,
+    ) -> list[Shard]:
+        step = self.shard_size
+        return [
+            Shard(
+                file=file,
+                pages=pages[start : start + step],
+                settings=self.settings,
+                cache_root=self.cache.root if self.cache else None,
+                keys=keys[start : start + step] if keys else None,
+            )
+            for start in range(0, len(pages), step)
+        ]
+
+    def _plan(self, scans: list[PageScan], seen: set[str]) -> list[PageText | None]:
+        """Marks the pages that are dropped before extraction; None marks a page to extract."""
+        plan: list[PageText | None] = []
+        for scan in scans:
+            if (
+                self.page_filter.drop_blank
+                and not scan.has_text
+                and scan.variance < self.page_filter.blank_variance
+            ):
+                plan.append(PageText("", "blank"))
+            elif self.page_filter.drop_duplicates and scan.key in seen:
+                plan.append(PageText("", "duplicate"))
+            else:
+                seen.add(scan.key)
+                plan.append(None)
+        return plan
+
+    def _dedupe_text(self, page: PageText, seen: set[str]) -> PageText:
+        if not self.page_filter.drop_duplicates or not (key := _text_key(page.text)):
+            return page
+        if key in seen:
+            return PageText(
+                "", "duplicate", page.cached, estimate_tokens(page.text), page.timing
+            )
+        seen.add(key)
+        return page
+
+    def run(self, files: Iter[Path]) -> Generator[tuple[Path, Iterator[PageText]]]:
+        """
+        Yields each file alongside an iterator over its per-page text, in the order
+        the files were given.
+
+        Only a few shards per worker are extracted ahead of the consumer, so memory
+        stays flat however long the documents are. Each file's pages should be
+        consumed before moving on to the next file; any left over are discarded.
+        """
+        files = list(files)
+        page_counts = {}
+        for f in files:
+            with fitz.open(f) as doc:
+                page_counts[f] = doc.page_count
+
+        pool = (
+            ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            if self.workers > 1
+            else None
+        )
+        submit = pool.submit if pool else _Deferred
+        try:
+            scans = {
+                f: [submit(_scan_shard, s) for s in self._shards(f, range(page_counts[f]))]
+                for f in files
+                if self._filtering
+            }
+
+            keys: dict[Path, list[str] | None] = {}
+            plans: dict[Path, list[PageText | None]] = {}
+
+            def shards() -> Generator[Shard]:
+                # a file's extraction is planned only once its scans are in, so the
+                # scans of later files keep running meanwhile
+                for f in files:
+                    if self._filtering:
+                        file_scans = [
+                            scan for future in scans.pop(f) for scan in future.result()
+                        ]
+                        keys[f] = [scan.key for scan in file_scans]
+                        plans[f] = self._plan(file_scans, set())
+                    else:
+                        keys[f], plans[f] = None, [None] * page_counts[f]
+                    pages = [pno for pno, planned in enumerate(plans[f]) if planned is None]
+                    file_keys = keys[f]
+                    shard_keys = [file_keys[pno] for pno in pages] if file_keys else None
+                    yield from self._shards(f, pages, shard_keys)
+
+            pending = shards()
+            in_flight: deque[Future[list[PageText]] | _Deferred[list[PageText]]] = deque()
+
+            def submit_next() -> bool:
+                if (shard := next(pending, None)) is None:
+                    return False
+                in_flight.append(submit(_ocr_shard, shard))
+                return True
+
+            def extracted() -> Generator[PageText]:
+                while in_flight or submit_next():
+                    while len(in_flight) < 2 * self.workers and submit_next():
+                        pass
+                    yield from in_flight.popleft().result()
+
+            source = extracted()
+
+            def file_pages(f: Path) -> Generator[PageText]:
+                seen_texts: set[str] = set()
+                # token estimates of extracted pages by content key
+                tokens: dict[str, int] = {}
+                file_keys = keys[f]
+                for pno, planned in enumerate(plans.pop(f)):
+                    key = file_keys[pno] if file_keys else None
+                    if planned is None:
+                        page = self._dedupe_text(next(source), seen_texts)
+                        if key:
+                            tokens[key] = estimate_tokens(page.text)
+                    elif planned.method == "duplicate":
+                        page = planned._replace(tokens_saved=tokens.get(key, 0) if key else 0)
+                    else:
+                        page = planned
+                    yield page
+                del keys[f]
+
+            for f in files:
+                while f not in plans and submit_next():
+                    pass
+                pages = file_pages(f)
+                yield f, pages
+                # keep the shards of the following files in step
+                for _ in pages:
+                    pass
+        finally:
+            # drop queued shards if the consumer stopped early
+            if pool:
+                pool.shutdown(cancel_futures=True)
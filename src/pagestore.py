@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from .ocr import text_quality
+from .chunk import PAGE_BREAK
+
+import os
+import sqlite3
+import hashlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+    from .ocr import PageText
+
+from pathlib import Path
+
+_SCHEMA = typing.final("""
+CREATE TABLE IF NOT EXISTS pages (
+    document TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    method TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (document, page)
+) WITHOUT ROWID
+""")
+
+
+class StoredPage(typing.NamedTuple):
+    page: int
+    text: str
+    method: str
+    confidence: float
+    hash: str
+
+
+class PageStore:
+    """
+    Per-page plaintext for every document in a folder, kept in a single SQLite file.
+
+    Each row holds a page's text along with how it was extracted, a confidence score
+    (`text_quality` of the text) and a hash of the text, so pages can be read, compared
+    or re-validated individually. The form feed separated `.txt` files are exported
+    from it as a view.
+
+    Connections are not shared between threads; open one store per thread.
+    """
+
+    FILENAME = typing.final("pages.sqlite3")
+
+    file: Path
+
+    _conn: sqlite3.Connection
+
+    def __init__(self, directory: Path, *, mmap_size: int = 256 * 2**20) -> None:
+        self.file = directory / self.FILENAME
+        self._conn = sqlite3.connect(self.file)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self._conn.execute(_SCHEMA)
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def write(self, document: str, pages: Iter[PageText]) -> None:
+        """Replaces the pages of `document`, consuming `pages` as they are produced."""
+        rows = (
+            (
+                document,
+                pno,
+                page.text,
+                page.method,
+                text_quality(page.text),
+                hashlib.blake2b(page.text.encode("utf-8"), digest_size=16).hexdigest(),
+            )
+            for pno, page in enumerate(pages)
+        )
+        with self._conn:
+            self._conn.execute("DELETE FROM pages WHERE document = ?", (document,))
+            self._conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def __contains__(self, document: str) -> bool:
+        query = "SELECT 1 FROM pages WHERE document = ? LIMIT 1"
+        return self._conn.execute(query, (document,)).fetchone() is not None
+
+    def pages(
+        self,
+        document: str,
+        start: int = 0,
+        stop: int | None = None,
+    ) -> Generator[StoredPage]:
+        """Reads the pages of `document` in `[start, stop)` lazily, in page order."""
+        query = (
+            "SELECT page, text, method, confidence, hash FROM pages "
+            "WHERE document = ? AND page >= ? AND page < ? ORDER BY page"
+        )
+        stop = stop if stop is not None else 2**63 - 1
+        for row in self._conn.execute(query, (document, start, stop)):
+            yield StoredPage(*row)
+
+    def export(self, document: str, file: Path) -> Path:
+        """Writes the `.txt` view of `document` to `file`, one page at a time."""
+        tmp = file.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as out:
+            for page in self.pages(document):
+                if page.page:
+                    out.write(PAGE_BREAK)
+                out.write(page.text)
+        os.replace(tmp, file)
+        return file
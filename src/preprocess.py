@@ -1,27 +1,158 @@
 from __future__ import annotations
 
-from .utils import DATA_DIR, timings, console, argtype
+from .utils import DATA_DIR, timings, console, argtype, track, lazy_import
+from .manifest import digest
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from time import perf_counter
 
-import fitz
+import contextlib
+import os
+import csv
+import json
+import re
 import typing
 
 if typing.TYPE_CHECKING:
     from .typeshed import *
+    import fitz
+else:
+    fitz = lazy_import("fitz")
 
 from pathlib import Path
 
 
+type AutoSplitMode = typing.Literal["off", "propose", "apply"]
+
+_PAGE_COUNTER_RE = re.compile(r"^\s*(?:page\s+)?(\d{1,4})\s+of\s+(\d{1,4})\s*$", re.I | re.M)
+# the keyword must end on a word boundary ("Patient Identification" is no id) and
+# the id must hold a digit ("Patient Notified" is none either)
+_PATIENT_ID_RE = re.compile(
+    r"(?:patient\s*(?:#|(?:id|no|number)\b\.?)|mrn\b|"
+    r"medical\s+record\s*(?:#|(?:no|number)\b\.?))"
+    r"\s*:?\s*((?=[A-Z-]*\d)[A-Z0-9-]{4,})",
+    re.I,
+)
+_ENCOUNTER_DATE_RE = re.compile(
+    r"(?:date\s+of\s+service|dos|encounter\s+date|visit\s+date|service\s+date|"
+    r"admit(?:ted|ssion)?\s+date|evaluation\s+date)\s*:?\s*(\d{1,2}/\d{1,2}/\d{2,4})",
+    re.I,
+)
+
+
+class PageMarkers(typing.NamedTuple):
+    counter: tuple[int, int] | None
+    patient_id: str | None
+    encounter_date: str | None
+    header: str
+
+
+def _page_markers(text: str, header_lines: int = 6) -> PageMarkers:
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    header = chr(10).join(lines[:header_lines])
+    counters = _PAGE_COUNTER_RE.findall(text)
+    return PageMarkers(
+        counter=(int(counters[-1][0]), int(counters[-1][1])) if counters else None,
+        patient_id=(m.group(1).upper() if (m := _PATIENT_ID_RE.search(text)) else None),
+        encounter_date=(m.group(1) if (m := _ENCOUNTER_DATE_RE.search(header)) else None),
+        # digits vary from page to page within one encounter (page numbers, times)
+        # and the same header may wrap differently
+        header=re.sub(r"\d+", "#", " ".join(" ".join(lines[:2]).lower().split()))[:48],
+    )
+
+
+def detect_encounter_boundaries(doc: Document) -> list[int]:
+    """
+    Finds the 0-based pages that start a new encounter, using a cheap pass over the
+    native text layer (scanned pages without one carry no markers and never split).
+
+    A page starts a new encounter when its "N of M" page counter resets or changes
+    total, when the previous page completed its counter, when the patient
+    identifier or the encounter date in its header changes, or when its header
+    changes while neither page carries a page counter.
+    """
+    boundaries: list[int] = []
+    prev: PageMarkers | None = None
+    patient_id: str | None = None
+    encounter_date: str | None = None
+
+    for pno in range(doc.page_count):
+        markers = _page_markers(typing.cast(str, doc[pno].get_text()))
+        if prev is not None:
+            curr_counter, prev_counter = markers.counter, prev.counter
+            is_boundary = (
+                (curr_counter is not None and curr_counter[0] == 1)
+                or (
+                    curr_counter is not None
+                    and prev_counter is not None
+                    and curr_counter[1] != prev_counter[1]
+                )
+                or (prev_counter is not None and prev_counter[0] == prev_counter[1])
+                or (
+                    None not in (markers.patient_id, patient_id)
+                    and markers.patient_id != patient_id
+                )
+                or (
+                    None not in (markers.encounter_date, encounter_date)
+                    and markers.encounter_date != encounter_date
+                )
+                or (
+                    curr_counter is None
+                    and prev_counter is None
+                    and bool(markers.header)
+                    and markers.header != prev.header
+                )
+            )
+            if is_boundary:
+                boundaries.append(pno)
+        patient_id = markers.patient_id or patient_id
+        encounter_date = markers.encounter_date or encounter_date
+        prev = markers
+
+    return boundaries
+
+
+def _save_segment(data: bytes, path: Path) -> None:
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        doc.save(path, garbage=3, deflate=True)
+
+
+def _preprocess_entry(entry: JSONDict) -> tuple[str, float]:
+    """Runs a single manifest entry in a worker process, returning its duration."""
+    started_at = perf_counter()
+    worker = Preprocessor()
+    worker.file_in = Path(str(entry["file"]))
+    worker.out_dir = Path(str(entry["out_dir"])) if entry.get("out_dir") else None
+    worker.keep_original = entry.get("keep_original", True) is not False
+    worker.trim_start = int(typing.cast("str | int", entry.get("trim_start") or 0))
+    worker.trim_end = int(typing.cast("str | int", entry.get("trim_end") or -1))
+    worker.split_indices = typing.cast(list[int], entry.get("split_indices") or [])
+    worker.auto_split = typing.cast(AutoSplitMode, entry.get("auto_split") or "off")
+    # the batch pool already occupies every core
+    worker.save_workers = 1
+    worker.preprocess()
+    return str(entry["file"]), perf_counter() - started_at
+
+
 class Preprocessor:
     debug: bool = False
     keep_original: bool = True
+    save_workers: int | None = None
 
     file_in: Path
-    out_dir: Path
+    out_dir: Path | None
 
     trim_start: int
     trim_end: int
 
     split_indices: list[int]
+    auto_split: AutoSplitMode = "off"
+
+    _src: Document
+    _saver: ProcessPoolExecutor | None
+    _saves: list[Future[None]]
+
+    manifest: Path
+    batch_workers: int | None = None
 
     def _trim_range_exists(self) -> bool:
         return any(n > 0 for n in [self.trim_start, self.trim_end])
@@ -41,11 +172,14 @@ class Preprocessor:
         start_at: int = -1,
         suffix: str = "",
     ) -> None:
-        src = fitz.open(self.file_in)
-        out = fitz.open()
-        out.insert_pdf(src, from_page=from_page, to_page=to_page, start_at=start_at)
-        out.save(self._get_path(suffix))
-        src.close()
+        with fitz.open() as out:
+            out.insert_pdf(self._src, from_page=from_page, to_page=to_page, start_at=start_at)
+            if not self._saver:
+                out.save(self._get_path(suffix), garbage=3, deflate=True)
+                return
+            data = out.tobytes()
+        # garbage collection and compression dominate the save, so they run in the pool
+        self._saves.append(self._saver.submit(_save_segment, data, self._get_path(suffix)))
 
     @timings(strip_prefix="_")
     def _trim_doc(self) -> None:
@@ -67,23 +201,131 @@ class Preprocessor:
             )
             prev = curr
 
+    @timings(strip_prefix="_")
+    def _detect_splits(self) -> None:
+        """
+        Proposes split indices at detected encounter boundaries, and applies them when
+        `auto_split` is "apply" and no split indices were given explicitly.
+        """
+        first = max(self.trim_start or 1, 1) - 1
+        # a split index is the last page (1-based) of a segment, i.e. the 0-based
+        # start of the next one; the final index keeps the trailing segment
+        proposed = [b for b in detect_encounter_boundaries(self._src) if b > first]
+        proposed.append(self._src.page_count)
+
+        console.json(proposed_split_indices=typing.cast("JSONList", proposed))
+
+        if self.auto_split == "apply" and not self.split_indices:
+            self.split_indices = proposed
+
     @timings()
     def preprocess(self) -> None:
-        should_trim = self._trim_range_exists()
+        with fitz.open(self.file_in) as self._src:
+            if self.auto_split != "off":
+                self._detect_splits()
 
-        if not (self.split_indices or should_trim):
-            console.log("Nothing to preprocess.", "Exiting...")
-            return
+            should_trim = self._trim_range_exists()
 
-        if self.split_indices:
-            self._split_doc()
-        if should_trim:
-            self._trim_doc()
+            if not (self.split_indices or should_trim):
+                console.log("Nothing to preprocess.", "Exiting...")
+                return
+
+            self._saves = []
+            # a pool only pays for its startup (and the segments' second parse in the
+            # workers) when there are several segments to save side by side
+            segments = len(self.split_indices or ()) + should_trim
+            workers = min(segments, self.save_workers or os.cpu_count() or 1)
+            saver = ProcessPoolExecutor(workers) if workers > 1 else contextlib.nullcontext()
+            with saver as self._saver:
+                if self.split_indices:
+                    self._split_doc()
+                if should_trim:
+                    self._trim_doc()
+                for save in self._saves:
+                    save.result()
 
         if not self.keep_original:
             self.file_in.unlink()
             console.log("Removed original file.")
 
+    def _read_manifest(self) -> list[JSONDict]:
+        """
+        Reads batch entries from a JSON list of objects or a CSV file with the columns
+        `file`, `trim_start`, `trim_end`, `split_indices` and optionally `out_dir`,
+        `keep_original` and `auto_split`. Relative paths are resolved against the
+        manifest's folder.
+        """
+        text = self.manifest.read_text(encoding="utf-8")
+        if self.manifest.suffix.lower() == ".json":
+            entries: list[JSONDict] = json.loads(text)
+        else:
+            entries = [
+                {key: val for key, val in row.items() if val not in (None, "")}
+                for row in csv.DictReader(text.splitlines())
+            ]
+
+        base = self.manifest.parent
+        for entry in entries:
+            entry["file"] = (base / str(entry["file"])).resolve().as_posix()
+            if entry.get("out_dir"):
+                entry["out_dir"] = (base / str(entry["out_dir"])).resolve().as_posix()
+            if isinstance(splits := entry.get("split_indices"), str):
+                indices = argtype.integerlist(splits.replace(";", ","))
+                entry["split_indices"] = typing.cast("JSONList", indices)
+            if isinstance(keep := entry.get("keep_original"), str):
+                entry["keep_original"] = argtype.boolstring(keep)
+        return entries
+
+    @timings()
+    def preprocess_batch(self) -> None:
+        """
+        Preprocesses every entry of a manifest in a pool of worker processes.
+
+        Completed entries are appended to a `<manifest>.done` journal, so an interrupted
+        batch can be restarted and will only process the remaining entries.
+        """
+        journal = self.manifest.with_name(f"{self.manifest.name}.done")
+        done = set(journal.read_text(encoding="utf-8").split()) if journal.exists() else set()
+
+        entries = {digest(entry): entry for entry in self._read_manifest()}
+        pending = {key: entry for key, entry in entries.items() if key not in done}
+
+        if skipped := len(entries) - len(pending):
+            console.log(f"Skipping {skipped} entries completed by a previous run.")
+        if not pending:
+            console.log("Nothing to preprocess.", "Exiting...")
+            return
+
+        failures: list[str] = []
+        with (
+            ProcessPoolExecutor(self.batch_workers) as pool,
+            journal.open("a", encoding="utf-8") as log,
+        ):
+            futures = {
+                pool.submit(_preprocess_entry, entry): key for key, entry in pending.items()
+            }
+            for future in track(
+                iterable=as_completed(futures),
+                desc="preprocessing files",
+                total=len(futures),
+            ):
+                key = futures[future]
+                try:
+                    file, duration = future.result()
+                except Exception as e:
+                    failures.append(str(pending[key]["file"]))
+                    console.error(f"Failed to preprocess {pending[key]['file']}.", exception=e)
+                    continue
+                console.log(f"[Preprocess Batch]: {file} took {duration:.2f} seconds")
+                print(key, file=log, flush=True)
+
+        if failures:
+            console.error(
+                f"{len(failures)} of {len(pending)} entries failed.",
+                *failures,
+                exception=RuntimeError,
+            )
+
     @staticmethod
     def init_preprocess_args(subparsers: Subparsers) -> None:
         subparser = subparsers.add_parser(
@@ -130,6 +372,16 @@ class Preprocessor:
             widget="Textarea",
             type=argtype.integerlist,
         )
+        config.add_argument(
+            "--auto_split",
+            metavar="Automatic Splits",
+            choices=["off", "propose", "apply"],
+            default="off",
+            help="Detect encounter boundaries (page counter resets, patient identifier or "
+            "encounter date changes) from the text layer. 'propose' logs the detected split "
+            "indices; 'apply' uses them when no File Splits are given.",
+            type=str,
+        )
 
         trim_range = config.add_argument_group(
             "Trim Range",
@@ -160,3 +412,40 @@ class Preprocessor:
             help="If set to True, will print the program configuration and exit without execution.",
             type=argtype.boolstring,
         )
+
+        batch = subparsers.add_parser(
+            "preprocess_batch",
+            description="Preprocess many files at once from a manifest.",
+            prog="Preprocess Batch",
+        )
+        batch_options = batch.add_argument_group("Options")
+        batch_options.add_argument(
+            "--manifest",
+            metavar="Manifest File",
+            help="A CSV or JSON file listing the files to preprocess, with the columns "
+            "'file', 'trim_start', 'trim_end', 'split_indices' and optionally 'out_dir', "
+            "'keep_original' and 'auto_split'. Rerunning a manifest skips entries that "
+            "already completed.",
+            required=True,
+            widget="FileChooser",
+            gooey_options={"default_dir": DATA_DIR, "wildcard": "*.csv;*.json"},
+            type=Path,
+        )
+        batch_options.add_argument(
+            "--batch_workers",
+            metavar="Workers",
+            help="The number of files processed at once. Defaults to the number of CPU cores.",
+            widget="IntegerField",
+            gooey_options={"min": 1, "max": os.cpu_count() or 1},
+            default=os.cpu_count() or 1,
+            type=int,
+        )
+        batch_dev = batch.add_argument_group("Developer")
+        batch_dev.add_argument(
+            "--debug",
+            metavar="Debug",
+            choices=[True, False],
+            default=False,
+            help="If set to True, will print the program configuration and exit without execution.",
+            type=argtype.boolstring,
+        )
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from .utils import console
+from .telemetry import telemetry
+from .preprocess import Preprocessor
+from .analyze import Analyzer
+from argparse import ArgumentParser, Namespace, _ArgumentGroup
+
+import os
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+os.environ.setdefault(
+    "TESSDATA_PREFIX",
+    "C:\\Program Files\\Tesseract-OCR\\tessdata",
+)
+
+# keyword arguments understood by `GooeyParser` but not by `ArgumentParser`
+_GOOEY_KWARGS = typing.final(("widget", "gooey_options"))
+
+
+def _strip_gooey_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
+    # the GUI pre-fills fields from `initial_value`; without it they would be None
+    initial = (kwargs.get("gooey_options") or {}).get("initial_value")
+    if initial is not None and "default" not in kwargs:
+        kwargs = {**kwargs, "default": initial}
+    return {k: v for k, v in kwargs.items() if k not in _GOOEY_KWARGS}
+
+
+class _HeadlessGroup(_ArgumentGroup):
+    parser: HeadlessParser
+
+    def add_argument(self, *args: Any, **kwargs: Any):
+        return super().add_argument(*args, **_strip_gooey_kwargs(kwargs))
+
+    def add_argument_group(self, *args: Any, **kwargs: Any) -> _HeadlessGroup:
+        # Gooey nests groups for layout only; argparse gets them flattened
+        return self.parser.add_argument_group(*args, **kwargs)
+
+
+class HeadlessParser(ArgumentParser):
+    """
+    An `ArgumentParser` that accepts the Gooey-only options passed by the `init_*_args`
+    methods and ignores them, so the same options can be parsed without wx or Gooey.
+    """
+
+    def add_argument(self, *args: Any, **kwargs: Any):
+        return super().add_argument(*args, **_strip_gooey_kwargs(kwargs))
+
+    def add_argument_group(self, *args: Any, **kwargs: Any) -> _HeadlessGroup:
+        group = _HeadlessGroup(self, *args, **_strip_gooey_kwargs(kwargs))
+        group.parser = self
+        self._action_groups.append(group)
+        return group
+
+
+class Program(Namespace, Preprocessor, Analyzer):
+    command: str
+
+    @classmethod
+    def build_parser[P: ArgumentParser](cls, parser: P) -> P:
+        subparsers = typing.cast(
+            "Subparsers", parser.add_subparsers(help="Commands", dest="command")
+        )
+        cls.init_analysis_args(subparsers)
+        cls.init_preprocess_args(subparsers)
+        return parser
+
+    def invoke(self) -> None:
+        console.reset()
+        telemetry.reset()
+        # looked up on the class so that plain methods and `dumplocals` wrappers (which
+        # do not bind) are both called with the program as their only argument
+        func = getattr(type(self), "_debug" if self.debug else self.command, None)
+        if not callable(func):
+            raise TypeError("Invalid command.")
+        func(self)
+
+    def _debug(self) -> None:
+        console.debug(**{key: val for key, val in self.__dict__.items() if not callable(val)})
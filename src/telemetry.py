@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from contextvars import ContextVar
+from time import perf_counter
+
+import os
+import json
+import atexit
+import asyncio
+import itertools
+import threading
+import contextlib
+import multiprocessing
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+TRACE_FILE = Path(__file__).parent.parent.resolve() / "logs" / "trace.jsonl"
+
+_current_span: ContextVar[int | None] = ContextVar("current_span", default=None)
+
+
+def _micros(seconds: float) -> float:
+    return round(seconds * 1e6, 3)
+
+
+class Telemetry:
+    """
+    Records nested spans and counters as Chrome trace events, one JSON object per
+    line, so a run can be aggregated with any JSON tooling or loaded into Perfetto
+    after `export_chrome_trace`.
+
+    Spans are timed with `perf_counter`, which is a system-wide monotonic clock, so
+    timings measured in worker processes line up with the parent's. Each thread and
+    each asyncio task is drawn on its own track. Worker processes append to the same
+    file, flushing every event since pool workers exit without running `atexit`.
+    """
+
+    file: Path | None
+    counters: dict[str, float]
+
+    def __init__(self, file: Path | None = TRACE_FILE) -> None:
+        self.file = file
+        self.counters = {}
+        self._out: typing.TextIO | None = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._lanes: dict[int, int] = {}
+        self._pid = os.getpid()
+        self._child = multiprocessing.parent_process() is not None
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            # flush before forking so children do not inherit (and write again) the
+            # parent's buffered events, and do not inherit a held lock
+            os.register_at_fork(
+                before=self._before_fork,
+                after_in_parent=self._lock.release,
+                after_in_child=self._after_fork,
+            )
+
+    def _before_fork(self) -> None:
+        self._lock.acquire()
+        if self._out:
+            self._out.flush()
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._pid = os.getpid()
+        self._child = True
+
+    def reset(self) -> None:
+        """Starts a new trace, discarding the events and counters of earlier runs."""
+        with self._lock:
+            if self._out:
+                self._out.close()
+                self._out = None
+            if self.file and self.file.exists():
+                self.file.write_text("")
+            self.counters.clear()
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task else threading.get_ident()
+        if (lane := self._lanes.get(key)) is None:
+            lane = self._lanes[key] = len(self._lanes) + 1
+        return lane
+
+    def _emit(self, event: JSONDict) -> None:
+        if not self.file:
+            return
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if not self._out:
+                self.file.parent.mkdir(parents=True, exist_ok=True)
+                self._out = self.file.open("a", encoding="utf-8")
+            self._out.write(line + "\n")
+            if self._child:
+                self._out.flush()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: JSONSerializable) -> Generator[JSONDict]:
+        """
+        Times the enclosed block as a child of the enclosing span. The yielded dict
+        is recorded with the span, so results can be attached while it is open.
+        """
+        span_id = next(self._ids)
+        attrs: JSONDict = {**args, "id": span_id, "parent": _current_span.get()}
+        token = _current_span.set(span_id)
+        lane = self._lane()
+        start = perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = repr(e)
+            raise
+        finally:
+            end = perf_counter()
+            _current_span.reset(token)
+            self._complete(name, start, end, self._pid, lane, attrs)
+
+    def complete(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        *,
+        pid: int | None = None,
+        tid: int | None = None,
+        **args: JSONSerializable,
+    ) -> None:
+        """Records a span timed elsewhere, e.g. in a worker process."""
+        args.setdefault("parent", _current_span.get())
+        if tid is None:
+            tid = self._lane() if pid is None else 0
+        self._complete(name, start, end, pid or self._pid, tid, args)
+
+    def _complete(
+        self, name: str, start: float, end: float, pid: int, tid: int, args: JSONDict
+    ) -> None:
+        self._emit({
+            "name": name,
+            "ph": "X",
+            "ts": _micros(start),
+            "dur": _micros(end - start),
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        })
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Adds `value` to a named counter and records its new total."""
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        self._emit({
+            "name": name,
+            "ph": "C",
+            "ts": _micros(perf_counter()),
+            "pid": self._pid,
+            "args": {name: total},
+        })
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._out:
+                self._out.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._out:
+                self._out.close()
+                self._out = None
+
+
+def export_chrome_trace(source: Path = TRACE_FILE, target: Path | None = None) -> Path:
+    """
+    Wraps the events of a JSONL trace into the Chrome trace JSON format understood by
+    chrome://tracing and https://ui.perfetto.dev.
+    """
+    target = target or source.with_suffix(".json")
+    with source.open(encoding="utf-8") as src, target.open("w", encoding="utf-8") as dst:
+        dst.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        for n, line in enumerate(filter(str.strip, src)):
+            dst.write((",\n" if n else "") + line.strip())
+        dst.write("\n]}\n")
+    return target
+
+
+telemetry = Telemetry()
+
+
+if __name__ == "__main__":
+    import sys
+
+    print(export_chrome_trace(*map(Path, sys.argv[1:3])))
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from .cache import CACHE_DIR
+from collections import OrderedDict
+
+import re
+import hashlib
+import functools
+import typing
+
+if typing.TYPE_CHECKING:
+    from .typeshed import *
+
+from pathlib import Path
+
+type TokenCounter = Callable[[str], int]
+
+TOKENIZER_DIR = CACHE_DIR / "tokenizers"
+
+_PIECE_RE = re.compile(r"\d|[^\W\d]+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Offline token estimate for SentencePiece/BPE vocabularies: one token per digit
+    and punctuation mark, and one token per word plus one for every further six
+    characters, which tracks subword splitting of long or OCR-mangled words.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in _PIECE_RE.findall(text))
+
+
+def _load_tokenizer_file(file: Path) -> TokenCounter | None:
+    try:
+        # optional, installed by the `tokenizers` pixi environment
+        from tokenizers import Tokenizer  # pyright: ignore[reportMissingImports]
+    except ImportError:
+        return None
+    tokenizer = Tokenizer.from_file(str(file))
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+_factories: dict[str, Callable[[str], TokenCounter | None]] = {}
+
+
+def register_counter(prefix: str, factory: Callable[[str], TokenCounter | None]) -> None:
+    """
+    Registers a factory that builds a token counter for model ids starting with
+    `prefix`. Factories may return None to fall back to the next option.
+    """
+    _factories[prefix] = factory
+    resolve_counter.cache_clear()
+
+
+@functools.cache
+def resolve_counter(model_id: str) -> tuple[str, TokenCounter]:
+    """
+    Picks a token counter for `model_id`, in order of preference: a registered
+    factory, a `tokenizer.json` saved as `.cache/tokenizers/<model family>.json`
+    (requires the optional `tokenizers` package, e.g. `pixi run -e tokenizers start`),
+    then `estimate_tokens`.
+
+    Counters are kept for the life of the process, so a long-running service
+    loads each tokenizer once.
+    """
+    for prefix, factory in sorted(_factories.items(), key=lambda x: -len(x[0])):
+        if model_id.startswith(prefix) and (counter := factory(model_id)):
+            return prefix, counter
+
+    family = model_id.split(":")[0]
+    if (file := TOKENIZER_DIR / f"{family}.json").is_file():
+        if counter := _load_tokenizer_file(file):
+            return file.name, counter
+
+    return "estimate", estimate_tokens
+
+
+class TokenBudget:
+    """
+    Counts prompt tokens for a model and sizes the context window of each request.
+
+    Counts are memoized by content hash, so re-checking the same plaintext is free.
+    """
+
+    CTX_STEP: typing.ClassVar[int] = 2048
+
+    model_id: str
+    max_tokens: int
+    num_predict: int
+    source: str
+
+    _counter: TokenCounter
+    _counts: OrderedDict[str, int]
+    _cache_size: int
+
+    def __init__(
+        self,
+        model_id: str,
+        max_tokens: int,
+        num_predict: int,
+        *,
+        cache_size: int = 4096,
+    ) -> None:
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        self.num_predict = num_predict
+        self.source, self._counter = resolve_counter(model_id)
+        self._counts = OrderedDict()
+        self._cache_size = cache_size
+
+    @property
+    def prompt_budget(self) -> int:
+        """The number of tokens a prompt may use while leaving room for the response."""
+        return self.max_tokens - self.num_predict
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        if (n := self._counts.get(key)) is not None:
+            self._counts.move_to_end(key)
+            return n
+        n = self._counts[key] = self._counter(text)
+        if len(self._counts) > self._cache_size:
+            self._counts.popitem(last=False)
+        return n
+
+    def num_ctx(self, prompt_tokens: int) -> int:
+        """
+        Sizes the context window for a prompt, rounded up to the next power-of-two
+        multiple of `CTX_STEP` so that Ollama only ever sees a handful of distinct
+        sizes (it reloads the model whenever `num_ctx` changes).
+        """
+        needed = prompt_tokens + self.num_predict
+        size = self.CTX_STEP
+        while size < needed:
+            size *= 2
+        return min(size, self.max_tokens)
@@ -2,27 +2,47 @@ from __future__ import annotations
 
 from datetime import datetime, date
 from pathlib import Path
+from time import perf_counter
+from .telemetry import telemetry
 
+import os
+import re
 import json
 import sys
-import wx
+import queue
+import atexit
+import threading
+import multiprocessing
+import types
+import inspect
+import importlib.util
 import functools
+import contextlib
 import typing
 
 if typing.TYPE_CHECKING:
     from .typeshed import *
+    from types import TracebackType
 
-ROOT_DIR = Path(__file__).parent.parent.resolve(strict=True)
-
-DATA_DIR = (ROOT_DIR / "data").resolve(strict=True).as_posix()
 
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Returns module `name`, deferring its actual import until an attribute of it is
+    first used. Keeps heavy dependencies (fitz, ollama) out of startup.
+    """
+    if (module := sys.modules.get(name)) is not None:
+        return module
+    if (spec := importlib.util.find_spec(name)) is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = sys.modules[name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-def _fmt_time(dt: datetime) -> str:
-    return dt.strftime("%I:%M:%S %p")
 
+ROOT_DIR = Path(__file__).parent.parent.resolve(strict=True)
 
-def _diff_time(start: datetime, end: datetime | None = None) -> float:
-    return ((end or datetime.now()) - start).total_seconds()
+DATA_DIR = (ROOT_DIR / "data").resolve(strict=True).as_posix()
 
 
 def timings(
@@ -30,28 +50,44 @@ def timings(
     disp_name: str | None = None,
     strip_prefix: str = "_",
 ):
-    def decorator[**P, T](func: Callable[P, T]) -> Callable[P, T]:
-        nonlocal disp_name
+    """
+    Records each call of the decorated function as a telemetry span, and logs its
+    duration when it took longer than a second.
+    """
 
-        disp_name = disp_name or chr(32).join(
+    def decorator[**P, T](func: Callable[P, T]) -> Callable[P, T]:
+        name = disp_name or chr(32).join(
             x.strip().capitalize() for x in func.__name__.lstrip(strip_prefix).split("_")
         )
 
-        @functools.wraps(func)
-        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-            try:
-                started_at = datetime.now()
-                console.log(f"[{disp_name}]: started at {_fmt_time(started_at)}")
+        def log_completed(started: float) -> None:
+            duration = perf_counter() - started
+            if duration > 1:
+                console.log(f"[{name}]: took {duration:.2f} seconds")
 
-                result = func(*args, **kwargs)
+        if inspect.iscoroutinefunction(func):
 
-                ended_at = datetime.now()
-                console.log(f"[{disp_name}]: completed at {_fmt_time(ended_at)}")
+            @functools.wraps(func)
+            async def async_wrapper(*args: P.args, **kwargs: P.kwargs):
+                try:
+                    started = perf_counter()
+                    with telemetry.span(name):
+                        result = await func(*args, **kwargs)
+                    log_completed(started)
+                    return result
+                except Exception as e:
+                    console.error(f"An unhandled exception occured in {func.__name__}", e)
+                    raise
 
-                duration = _diff_time(started_at, ended_at)
-                if duration > 1:
-                    console.log(f"[{disp_name}]: took {duration} seconds")
+            return typing.cast("Callable[P, T]", async_wrapper)
 
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            try:
+                started = perf_counter()
+                with telemetry.span(name):
+                    result = func(*args, **kwargs)
+                log_completed(started)
                 return result
             except Exception as e:
                 console.error(f"An unhandled exception occured in {func.__name__}", e)
@@ -116,39 +152,29 @@ class dumplocals[**P, T]:
 
     def __call__(self, *args: P.args, **kwargs: P.kwargs) -> T:
         """
-        The main decorator logic. Sets up a tracer and calls the function.
+        The main decorator logic. Calls the function and, only if it raises, recovers
+        its locals from the traceback, so a successful call costs nothing extra.
         """
-        # We need to save the original profile function to restore it later
-        original_profile_func = sys.getprofile()
-
-        def tracer(frame, event, arg):
-            """
-            The tracer function that captures locals on return or exception.
-            """
-            # Check for the frame of the decorated function itself
-            if frame.f_code is self.func.__code__:
-                if event == "return":
-                    # For a normal return, capture the locals from the frame
-                    self._locals = frame.f_locals.copy()
-                elif event == "exception":
-                    # When an exception is raised, capture the locals from the frame
-                    self._locals = frame.f_locals.copy()
-
-            # This is important to not break other profilers
-            if original_profile_func:
-                original_profile_func(frame, event, arg)
-
-        sys.setprofile(tracer)
         try:
-            res = self.func(*args, **kwargs)
+            return self.func(*args, **kwargs)
         except Exception as e:
+            self._locals = self._capture(e.__traceback__)
             self.write_locals()
             raise SystemExit from e
         finally:
-            sys.setprofile(original_profile_func)
             self.clear_locals()
 
-        return res
+    def _capture(self, tb: TracebackType | None) -> dict[str, Any]:
+        """
+        Copies the locals of the innermost frame of the decorated function found in
+        the traceback `tb`.
+        """
+        captured = {}
+        while tb is not None:
+            if tb.tb_frame.f_code is self.func.__code__:
+                captured = dict(tb.tb_frame.f_locals)
+            tb = tb.tb_next
+        return captured
 
     def clear_locals(self):
         """
@@ -203,6 +229,18 @@ class argtype:
             return value.strip()
         raise TypeError("Must be a string not containing any whitespaces.")
 
+    @staticmethod
+    def duration(value) -> float | str:
+        # numbers are seconds; otherwise Go style durations as accepted by Ollama
+        value = str(value).strip()
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        if re.fullmatch(r"-?(\d+(\.\d+)?(ns|us|ms|s|m|h))+", value):
+            return value
+        raise TypeError("Must be a number of seconds or a duration like '30m' or '1h30m'.")
+
     @staticmethod
     def integerlist(value) -> list[int]:
         try:
@@ -211,10 +249,162 @@ class argtype:
             raise TypeError("All values in the list must be integers.")
 
 
+class LogWriter:
+    """
+    Appends log messages to a file from a background thread.
+
+    Messages are queued (blocking once `max_queued` are pending, so a burst cannot
+    grow memory without bound), written in batches, and the file is rotated to
+    `<name>.1`..`<name>.<backups>` once it would grow past `max_bytes`. Messages that
+    cannot be written (e.g. the file is not writable) are dropped with a warning on
+    stderr rather than stopping the writer, so `flush` never waits on a dead thread.
+    """
+
+    file: Path
+    max_bytes: int
+    backups: int
+
+    def __init__(
+        self,
+        file: Path,
+        *,
+        max_bytes: int = 16 * 2**20,
+        backups: int = 3,
+        max_queued: int = 4096,
+    ) -> None:
+        self.file = file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.Queue[str | None] = queue.Queue(max_queued)
+        self._out: typing.TextIO | None = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._failing = False
+        # pool workers end with os._exit, which skips atexit, so they write directly
+        self._threaded = multiprocessing.parent_process() is None
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            # forked children have no writer thread; holding the lock across the fork
+            # keeps them from inheriting it mid-write
+            os.register_at_fork(
+                before=self._lock.acquire,
+                after_in_parent=self._lock.release,
+                after_in_child=self._after_fork,
+            )
+
+    def _after_fork(self) -> None:
+        # messages still queued belong to the parent, which writes them itself
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._thread = None
+        self._threaded = False
+        self._out = None
+
+    def write(self, message: str) -> None:
+        if not self._threaded:
+            with self._lock:
+                self._write_safely([message])
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        self._queue.put(message)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    self._write_safely([m for m in batch if m is not None])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                return
+
+    def _write_safely(self, messages: list[str]) -> None:
+        try:
+            self._write_batch(messages)
+        except Exception as e:
+            if self._out:
+                with contextlib.suppress(OSError):
+                    self._out.close()
+                self._out = None
+            if not self._failing:
+                print(f"Could not write to {self.file}: {e!r}", file=sys.stderr, flush=True)
+            self._failing = True
+        else:
+            self._failing = False
+
+    def _write_batch(self, messages: list[str]) -> None:
+        if not messages:
+            return
+        if self._out is None:
+            self._out = self.file.open("a", encoding="utf-8")
+            self._size = self._out.tell()
+        for message in messages:
+            # sizes are counted in characters, which is close enough for rotation
+            if self._size and self._size + len(message) > self.max_bytes:
+                self._rotate()
+            self._out.write(message)
+            self._size += len(message)
+        self._out.flush()
+
+    def _rotate(self) -> None:
+        if self._out:
+            self._out.close()
+        try:
+            for n in range(self.backups - 1, 0, -1):
+                if (older := self.file.with_name(f"{self.file.name}.{n}")).exists():
+                    os.replace(older, self.file.with_name(f"{self.file.name}.{n + 1}"))
+            if self.backups:
+                os.replace(self.file, self.file.with_name(f"{self.file.name}.1"))
+        except OSError:
+            # on Windows the file cannot be moved while a worker process has it open;
+            # keep appending and try again once another `max_bytes` have been written
+            self._out = self.file.open("a", encoding="utf-8")
+        else:
+            self._out = self.file.open("w", encoding="utf-8")
+        self._size = 0
+
+    def flush(self) -> None:
+        """Blocks until every queued message has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def truncate(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._out:
+                self._out.close()
+                self._out = None
+            with contextlib.suppress(OSError):
+                self.file.write_text("", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        with self._lock:
+            if self._out:
+                self._out.close()
+                self._out = None
+
+
 class console:
     NEWLINE = typing.final(chr(13) + chr(10) if sys.platform == "win32" else chr(10))
     FILE = typing.final(LOG_DIR / "latest-execution.log")
     WHITELIST = typing.final(["progress"])
+    _WHITELIST_RE = typing.final(re.compile("|".join(map(re.escape, WHITELIST)), re.I))
     BLACKLIST = typing.final([
         "mupdf error",
         "image too small",
@@ -242,16 +432,30 @@ class console:
         data: JSONDict = obj if not key else {key: obj}
         cls.log(json.dumps(obj=data, indent=indent))
 
+    _writer: typing.ClassVar[LogWriter | None] = None
+
+    @classmethod
+    def writer(cls) -> LogWriter:
+        if cls._writer is None:
+            cls._writer = LogWriter(cls.FILE)
+        return cls._writer
+
+    @classmethod
+    def reset(cls) -> None:
+        """Empties the log file, e.g. at the start of a run."""
+        cls.writer().truncate()
+
     @classmethod
     def log(cls, *lines: object) -> None:
-        text = " ".join(str(line).lower() for line in lines)
-        if all(item not in text for item in cls.WHITELIST) or any(
-            item in text for item in cls.BLACKLIST
-        ):
-            with cls.FILE.open("a+t", encoding="utf-8") as f:
-                print(*lines, sep=cls.NEWLINE, file=f)
-        else:
-            print(*lines, sep=cls.NEWLINE, file=sys.stdout, flush=True)
+        strings = [str(line) for line in lines]
+        # only whitelisted messages need the (costlier) blacklist check; everything
+        # else, like the prompts dumped per file, goes straight to the log file
+        if any(cls._WHITELIST_RE.search(string) for string in strings):
+            text = " ".join(strings).lower()
+            if all(item not in text for item in cls.BLACKLIST):
+                print(*strings, sep=cls.NEWLINE, file=sys.stdout, flush=True)
+                return
+        cls.writer().write(cls.NEWLINE.join(strings) + "\n")
 
     @staticmethod
     def error(
@@ -263,8 +467,20 @@ class console:
         lines and console.log(lines)
         fatal and sys.exit(1)
 
-    @staticmethod
-    def confirm(prompt: str) -> bool:
+    # answers every confirmation without asking when set, e.g. for queued jobs
+    auto_confirm: typing.ClassVar[bool | None] = None
+
+    @classmethod
+    def confirm(cls, prompt: str) -> bool:
+        if cls.auto_confirm is not None:
+            cls.log(f"{prompt} {'yes' if cls.auto_confirm else 'no'} (automatic)")
+            return cls.auto_confirm
+        # headless runs have no wx.App to parent a dialog to, so ask on the terminal
+        if (wx := sys.modules.get("wx")) is None or not wx.App.Get():
+            try:
+                return input(f"{prompt} [y/N] ").strip().lower() in ("y", "yes")
+            except EOFError:
+                return False
         dialogue = wx.MessageDialog(
             parent=None,
             message=prompt,
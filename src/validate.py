@@ -1,13 +1,67 @@
 from __future__ import annotations
 
+import os
 import re
+import json
 import typing as ty
 from .utils import timings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 from .typeshed import ValidationSubject, ValidatedResult
 
 if ty.TYPE_CHECKING:
     from .typeshed import *
+    from .clean import CleanupSettings, OffsetMap
+
+TOKEN_RE = ty.final(re.compile(r"\w+", re.UNICODE))
+
+
+class PlaintextIndex:
+    """Word index over a document, built once and shared by every scored item.
+
+    Tokens are lowercased `\\w+` runs. Phrase lookups anchor on the phrase's
+    rarest word and compare only the token windows around its occurrences, so a
+    lookup costs O(occurrences of that word) instead of a scan of the document.
+
+    When the document was cleaned before indexing, `offsets` maps its character
+    positions back to the original text and `spans` are reported in the original.
+    """
+
+    def __init__(self, plaintext: str, offsets: OffsetMap | None = None) -> None:
+        self.offsets = offsets
+        self.spans: list[tuple[int, int]] = []
+        self.tokens: list[str] = []
+        self.positions: dict[str, list[int]] = {}
+        for i, m in enumerate(TOKEN_RE.finditer(plaintext)):
+            token = m.group().lower()
+            self.spans.append(offsets.span(*m.span()) if offsets else m.span())
+            self.tokens.append(token)
+            self.positions.setdefault(token, []).append(i)
+
+    def find(self, words: Sequence[str]) -> list[int]:
+        """Return the token positions at which the phrase `words` starts."""
+        if not words:
+            return []
+        try:
+            offset, anchor = min(enumerate(words), key=lambda x: len(self.positions[x[1]]))
+        except KeyError:
+            return []
+        n = len(words)
+        words = list(words)
+        return [
+            start
+            for p in self.positions[anchor]
+            if (start := p - offset) >= 0 and self.tokens[start : start + n] == words
+        ]
+
+    def locate(self, words: Sequence[str]) -> list[tuple[int, int]]:
+        """Return the character spans at which the phrase `words` occurs."""
+        n = len(words)
+        return [(self.spans[i][0], self.spans[i + n - 1][1]) for i in self.find(words)]
+
+    def __contains__(self, words: Sequence[str]) -> bool:
+        return bool(self.find(words))
 
 
 class ValidationDict(dict[ValidationSubject, ValidatedResult]):
@@ -22,15 +76,26 @@ class ValidationDict(dict[ValidationSubject, ValidatedResult]):
     _subjects = ty.final(("injuries", "treatments"))
     _verdicts = ty.final(("verified", "unverified"))
 
-    def __init__(self, plaintext: str, analysis_results) -> None:
+    def __init__(
+        self,
+        plaintext: str,
+        analysis_results,
+        index: PlaintextIndex | None = None,
+        offsets: OffsetMap | None = None,
+    ) -> None:
         # counts are per-item (not per-token)
         self.match_counts = {s: {v: 0 for v in self._verdicts} for s in self._subjects}
         self.plaintext = plaintext
+        self.index = index or PlaintextIndex(plaintext, offsets)
         self.base_results = analysis_results
         super().__init__()
         for s in self._subjects:
             self[s] = {v: {} for v in self._verdicts}
 
+    def locate(self, phrase: str) -> list[tuple[int, int]]:
+        """Return the spans of a matched phrase in the original (uncleaned) text."""
+        return self.index.locate(TOKEN_RE.findall(phrase.lower()))
+
     def _set(
         self,
         item: str,
@@ -47,10 +112,11 @@ class ValidationDict(dict[ValidationSubject, ValidatedResult]):
         """Compute a confidence score [0,1] and return the list of matched phrases.
 
         Algorithm (greedy n-gram match):
-        - Tokenize the item and the plaintext into lowercase words.
+        - Tokenize the item into lowercase words; the plaintext was tokenized
+          once into `self.index`.
         - Walk the item tokens left-to-right and at each position greedily try the
-          longest n-gram (within the remaining tokens) that occurs in the
-          plaintext.
+          longest n-gram (within the remaining tokens) that occurs as consecutive
+          words in the plaintext.
         - Each matched n-gram of length r contributes r points (for the words)
           plus a non-linear bonus proportional to r*(r-1)/2 scaled by
           `bonus_factor`. This rewards longer consecutive matches.
@@ -58,13 +124,10 @@ class ValidationDict(dict[ValidationSubject, ValidatedResult]):
           token length so the returned confidence is in [0,1].
         """
 
-        token_re = re.compile(r"\w+", re.UNICODE)
-        words = token_re.findall(item_str.lower())
+        words = TOKEN_RE.findall(item_str.lower())
         if not words:
             return 0.0, []
 
-        plaintext = self.plaintext.lower()
-
         i = 0
         runs: list[int] = []
         matched_phrases: list[str] = []
@@ -74,10 +137,9 @@ class ValidationDict(dict[ValidationSubject, ValidatedResult]):
             found_len = 0
             # try longest n-gram first (greedy)
             for L in range(n - i, 0, -1):
-                phrase = " ".join(words[i : i + L])
-                if phrase in plaintext:
+                if words[i : i + L] in self.index:
                     found_len = L
-                    matched_phrases.append(phrase)
+                    matched_phrases.append(" ".join(words[i : i + L]))
                     break
 
             if found_len > 0:
@@ -115,3 +177,132 @@ class ValidationDict(dict[ValidationSubject, ValidatedResult]):
                 self._set(item_str, matches, confidence, subj, verdict)
 
         return self, self.match_counts
+
+
+def _validate_one(
+    job: tuple[str, str, AnalysisResults, float, CleanupSettings | None],
+) -> tuple[str, dict[ValidationSubject, ValidatedResult], ValidationSummary]:
+    name, plaintext, analysis_results, threshold, cleanup = job
+    offsets = None
+    if cleanup:
+        from .clean import clean_text
+
+        plaintext, offsets = clean_text(plaintext, cleanup)
+    results, match_counts = ValidationDict(
+        plaintext, analysis_results, offsets=offsets
+    ).validate(threshold)
+    # plain dicts keep the document index out of the pickled result
+    return name, dict(results), match_counts
+
+
+def validate_batch(
+    pairs: Mapping[str, tuple[str, AnalysisResults]],
+    *,
+    threshold: float = 0.5,
+    workers: int | None = None,
+    cleanup: Mapping[str, CleanupSettings | None] | None = None,
+) -> tuple[dict[str, dict[ValidationSubject, ValidatedResult]], dict[str, ValidationSummary]]:
+    """Validate many (plaintext, analysis results) pairs across a process pool.
+
+    Plaintext named in `cleanup` is cleaned with the given settings first, as it
+    was before analysis. Returns the validated results and the match counts, both
+    keyed like `pairs`.
+    """
+
+    cleanup = cleanup or {}
+    jobs = [
+        (name, text, res, threshold, cleanup.get(name)) for name, (text, res) in pairs.items()
+    ]
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+
+    if workers <= 1:
+        outcomes = map(_validate_one, jobs)
+        return _collect(outcomes)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        return _collect(pool.map(_validate_one, jobs, chunksize=chunksize))
+
+
+def _collect(
+    outcomes: Iterable[
+        tuple[str, dict[ValidationSubject, ValidatedResult], ValidationSummary]
+    ],
+) -> tuple[dict[str, dict[ValidationSubject, ValidatedResult]], dict[str, ValidationSummary]]:
+    results: dict[str, dict[ValidationSubject, ValidatedResult]] = {}
+    match_counts: dict[str, ValidationSummary] = {}
+    for name, result, counts in outcomes:
+        results[name], match_counts[name] = result, counts
+    return results, match_counts
+
+
+def load_analysis_results(file: Path) -> AnalysisResults:
+    """Recover the items the LLM returned from a written `*_analysis.json` file."""
+
+    data = json.loads(file.read_text(encoding="utf-8"))
+    return {
+        subj: list(
+            dict.fromkeys(item for verdict in data.get(subj, {}).values() for item in verdict)
+        )
+        for subj in ValidationDict._subjects
+    }
+
+
+def revalidate_tree(
+    root: Path,
+    *,
+    threshold: float = 0.5,
+    workers: int | None = None,
+) -> dict[str, ValidationSummary]:
+    """Re-validate every analysis under `root` without calling the LLM again.
+
+    Looks for `analysis/<stem>_analysis.json` files with a sibling
+    `plaintext/<stem>.txt` (the default folder layout) and rewrites them in place,
+    along with the match counts recorded in the folder's manifest. Plaintext is
+    cleaned with the settings recorded in the manifest, so verdicts match those of
+    the analysis run.
+    """
+    from .clean import CleanupSettings
+    from .manifest import RunManifest
+
+    files: dict[str, tuple[Path, Path]] = {}
+    cleanup: dict[str, CleanupSettings | None] = {}
+    manifests: dict[Path, RunManifest] = {}
+    for out_file in root.rglob("analysis/*_analysis.json"):
+        stem = out_file.name.removesuffix("_analysis.json")
+        text_file = out_file.parent.parent / "plaintext" / f"{stem}.txt"
+        if text_file.is_file():
+            name = out_file.relative_to(root).as_posix()
+            files[name] = text_file, out_file
+            if out_file.parent not in manifests:
+                manifests[out_file.parent] = RunManifest(out_file.parent)
+            parameters = manifests[out_file.parent].get(stem, "parameters")
+            settings = parameters.get("cleanup") if isinstance(parameters, dict) else None
+            cleanup[name] = (
+                CleanupSettings(**ty.cast("dict[str, Any]", settings))
+                if isinstance(settings, dict)
+                else None
+            )
+
+    results, match_counts = validate_batch(
+        {
+            name: (text_file.read_text(encoding="utf-8"), load_analysis_results(out_file))
+            for name, (text_file, out_file) in files.items()
+        },
+        threshold=threshold,
+        workers=workers,
+        cleanup=cleanup,
+    )
+
+    for name, (_, out_file) in files.items():
+        out_file.write_text(json.dumps(results[name], indent=4))
+        stem = out_file.name.removesuffix("_analysis.json")
+        manifests[out_file.parent].amend(
+            stem, match_counts=ty.cast("JSONDict", match_counts[name])
+        )
+
+    for manifest in manifests.values():
+        if manifest.entries:
+            manifest.save()
+
+    return match_counts